@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.services.auth import principal_cache, require_admin
+from app.services.catalog import catalog_syncer
+from app.services.manager import list_cache
+from app.services.profiling import get_profile, profiles
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+# CACHE ROUTES
+@router.get("/cache/stats")
+async def cache_stats():
+    return {
+        "principals": principal_cache.stats(),
+        "lists": list_cache.stats(),
+    }
+
+
+@router.delete("/cache/images")
+async def invalidate_image_cache(region: str | None = None):
+    catalog_syncer.mark_stale(region)
+    return {"message": "Image catalog resync scheduled", "region": region}
+
+
+# PROFILING ROUTES
+@router.get("/profiles")
+async def list_profiles():
+    return {"profiles": [p.summary() for p in reversed(profiles)]}
+
+
+@router.get("/profiles/{profile_id}")
+async def profile_breakdown(profile_id: int):
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.summary()
+
+
+@router.get("/profiles/{profile_id}/folded", response_class=PlainTextResponse)
+async def profile_stacks(profile_id: int):
+    """Stack samples in collapsed form, for flamegraph.pl or speedscope."""
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.folded()
@@ -2,7 +2,8 @@ import os
 from typing import Annotated
 from fastapi import APIRouter, Depends, Query
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.deps import get_db
 from app.models.auth_model import AuthRequest
 from app.schemas.auth_request import AWS_User
@@ -14,10 +15,11 @@ REFRESH_TOKEN_EXPIRE_DAYS = os.getenv("REFRESH_TOKEN_EXPIRE_DAYS")
 
 
 @router.post("/register")
-def register_user(data: AuthRequest, db: Session = Depends(get_db)):
+async def register_user(data: AuthRequest, db: AsyncSession = Depends(get_db)):
     fp = get_aws_fingerprint(data.aws_access_key_id, data.aws_secret_access_key)
 
-    user = db.query(AWS_User).filter_by(aws_fp=fp).first()
+    result = await db.execute(select(AWS_User).filter_by(aws_fp=fp))
+    user = result.scalar_one_or_none()
 
     if not user:
         enc_key, enc_secret = encrypt_aws_creds(
@@ -29,8 +31,12 @@ def register_user(data: AuthRequest, db: Session = Depends(get_db)):
         )
 
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+    elif user.region != data.region:
+        user.region = data.region
+        await db.commit()
+        await invalidate_principal_async(user.id)
 
     access_token = create_access_token({"sub": str(user.id)})
 
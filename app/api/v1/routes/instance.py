@@ -1,104 +1,460 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends, Query
-from app.models.ec2 import InstanceLaunchRequest, KeyPairRequest
-from app.services.auth import decrypt_aws_creds, get_current_user
+from datetime import datetime
+from typing import Annotated, Literal
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+import orjson
+from app.models.ec2 import (
+    ExposureReport,
+    Image,
+    ImageList,
+    Instance,
+    InstanceBatchRequest,
+    InstanceLaunchRequest,
+    InstanceList,
+    KeyPair,
+    KeyPairList,
+    KeyPairRequest,
+    SecurityGroup,
+    SecurityGroupList,
+    SecurityGroupRulesRequest,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.deps import get_db
+from app.services.auth import get_current_creds, get_websocket_creds
+from app.services.catalog import list_catalog_images
+from app.services.events import format_sse, instance_events
+from app.services.executor import (
+    iterate_blocking,
+    mutation_executor,
+    run_blocking,
+    run_on,
+)
+from app.services.fanout import REGION_PATTERN, fan_out, merge_tagged, resolve_regions
+from app.services.inventory import (
+    inventory_syncer,
+    list_local_instances,
+    record_results,
+)
+from app.services.jobs import job_store
+from app.services.rules import parse_network
+from app.services.serialize import NDJSON, list_response, parse_fields, project
 from app.services.manager import *
 
 router = APIRouter(prefix="/instances")
+EVENTS_KEEPALIVE_SECONDS = 15
 
 
-def get_aws_creds(user):
-    _access_key, _secret_key = decrypt_aws_creds(user.access_key, user.access_secret)
-    return dict(access_key=_access_key, secret_key=_secret_key, region=user.region)
+async def run_or_submit(run_async: bool, owner, operation: str, fn, **kwargs):
+    """Runs `fn` inline, or as a background job answered with 202 when `?async=true`."""
+    if run_async:
+        job = job_store.submit(owner, operation, fn, **kwargs)
+        return JSONResponse(job, status_code=202)
+    return await run_on(mutation_executor, fn, **kwargs)
+
+
+async def run_lifecycle(
+    run_async: bool, user_creds: dict, operation: str, fn, region=None, **kwargs
+):
+    """`run_or_submit` for state-changing calls, written through to the inventory."""
+    user_id, region = user_creds["user_id"], region or user_creds["region"]
+    response = await run_or_submit(
+        run_async, user_id, operation, fn, user=user_creds, **kwargs
+    )
+    if run_async:
+        inventory_syncer.mark_dirty(user_id, region)
+    else:
+        await record_results(user_id, region, response)
+    instance_events.wake(user_creds, region)
+    return response
 
 
 # SESSION ROUTES
 @router.get("/identify")
-def get_identity(user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    identity = identify(user=user_creds)
+async def get_identity(user_creds=Depends(get_current_creds)):
+    identity = await run_blocking(identify, user=user_creds)
     return {"message": "identified!", "identity": f"{identity}"}
 
 
-@router.get("/images")
-def describe(user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    response = describe_images(user=user_creds)
-    return {"response": response}
+@router.get("/images", response_model=ImageList)
+async def describe(
+    request: Request,
+    name: str | None = None,
+    architecture: str | None = None,
+    owner: str | None = None,
+    virtualization_type: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    latest: bool = False,
+    region: Annotated[str | None, Query(pattern=REGION_PATTERN.pattern)] = None,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    next_token: str | None = None,
+    sort: Annotated[str, Query(pattern=r"^-?(creation_date|name)$")] = (
+        "-creation_date"
+    ),
+    fields: str | None = None,
+    user_creds=Depends(get_current_creds),
+    db: AsyncSession = Depends(get_db),
+):
+    """Searches the local AMI catalog; `name` is a prefix, `latest` the newest match."""
+    fields = parse_fields(fields, Image)
+    response = await list_catalog_images(
+        db,
+        user_creds,
+        region=region,
+        name=name,
+        architecture=architecture,
+        owner=owner,
+        virtualization_type=virtualization_type,
+        created_after=created_after,
+        created_before=created_before,
+        sort=sort,
+        limit=limit,
+        next_token=next_token,
+        latest=latest,
+    )
+    return list_response(response, "images", fields, request)
 
 
 # INSTANCE ROUTES
-@router.get("/")
-def _describe_instances(user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    response = describe_instances(user=user_creds)
-    return {"response": response}
+@router.get("/", response_model=InstanceList)
+async def _describe_instances(
+    request: Request,
+    state: Annotated[list[str] | None, Query()] = None,
+    instance_type: Annotated[list[str] | None, Query()] = None,
+    tag: Annotated[list[str] | None, Query()] = None,
+    vpc_id: Annotated[list[str] | None, Query()] = None,
+    limit: Annotated[int | None, Query(ge=1, le=1000)] = None,
+    next_token: str | None = None,
+    source: Literal["aws", "local"] = "aws",
+    regions: str | None = None,
+    sort: Annotated[
+        str, Query(pattern=r"^-?(launch_time|state|instance_type)$")
+    ] = "-launch_time",
+    fields: str | None = None,
+    user_creds=Depends(get_current_creds),
+    db: AsyncSession = Depends(get_db),
+):
+    fields = parse_fields(fields, Instance)
+
+    if source == "local":
+        if regions:
+            # Local listings only cover the account's home region.
+            raise HTTPException(
+                status_code=422, detail="regions can't be combined with source=local"
+            )
+        response = await list_local_instances(
+            db,
+            user_creds,
+            state=state,
+            instance_type=instance_type,
+            tag=tag,
+            vpc_id=vpc_id,
+            sort=sort,
+            limit=limit,
+            next_token=next_token,
+        )
+        return list_response(response, "instances", fields, request)
+
+    filters = instance_filters(
+        state=state, instance_type=instance_type, tag=tag, vpc_id=vpc_id
+    )
+
+    if regions:
+        names = await resolve_regions(user_creds, regions)
+        results, errors = await fan_out(
+            list_instances, user_creds, names, filters=filters
+        )
+        response = {"instances": merge_tagged(results, "instances"), "errors": errors}
+        return list_response(response, "instances", fields, request)
+
+    if NDJSON in request.headers.get("accept", ""):
+        instances = iter_instances(user=user_creds, filters=filters)
+        lines = (
+            orjson.dumps(project(instance, fields)) + b"\n"
+            async for instance in iterate_blocking(instances)
+        )
+        return StreamingResponse(lines, media_type=NDJSON)
+
+    response = await run_blocking(
+        describe_instances,
+        user=user_creds,
+        filters=filters,
+        limit=limit,
+        next_token=next_token,
+    )
+    return list_response(response, "instances", fields, request)
+
+
+@router.get("/events")
+async def stream_events(
+    region: Annotated[str | None, Query(pattern=REGION_PATTERN.pattern)] = None,
+    last_event_id: Annotated[str | None, Header()] = None,
+    user_creds=Depends(get_current_creds),
+):
+    """Server-Sent Events stream of the account's instance state transitions."""
+    subscription = instance_events.subscribe(
+        dict(user_creds, region=region or user_creds["region"]), last_event_id
+    )
+
+    async def events():
+        try:
+            while True:
+                event = await subscription.next(EVENTS_KEEPALIVE_SECONDS)
+                if subscription.overflowed:
+                    return
+                yield format_sse(event) if event else b": keepalive\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/events")
+async def websocket_events(
+    websocket: WebSocket,
+    region: Annotated[str | None, Query(pattern=REGION_PATTERN.pattern)] = None,
+    last_event_id: str | None = None,
+    user_creds=Depends(get_websocket_creds),
+):
+    """WebSocket equivalent of `GET /events`; each message is one JSON event."""
+    await websocket.accept()
+    subscription = instance_events.subscribe(
+        dict(user_creds, region=region or user_creds["region"]), last_event_id
+    )
+    try:
+        while True:
+            event = await subscription.next(EVENTS_KEEPALIVE_SECONDS)
+            if subscription.overflowed:
+                # 1013 "try again later": reconnect with the last event id.
+                await websocket.close(code=1013)
+                return
+            message = {"event": "keepalive"}
+            if event:
+                message = {k: event[k] for k in ("event", "id", "data") if k in event}
+            await websocket.send_text(orjson.dumps(message).decode())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
 
 
 @router.post("/")
-def launch_instance(data: InstanceLaunchRequest, user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    result = launch_ec2_instance(data, user_creds)
-    return result
+async def launch_instance(
+    request: Request,
+    data: InstanceLaunchRequest,
+    run_async: Annotated[bool, Query(alias="async")] = False,
+    user_creds=Depends(get_current_creds),
+):
+    if NDJSON in request.headers.get("accept", "") and not run_async:
+        return await stream_launch(data, user_creds)
+    return await run_lifecycle(
+        run_async,
+        user_creds,
+        "launch",
+        launch_ec2_instance,
+        region=data.region,
+        data=data,
+    )
+
+
+async def stream_launch(data: InstanceLaunchRequest, user_creds: dict):
+    """Launches, then streams one NDJSON line per instance as it becomes running."""
+    user_id, region = user_creds["user_id"], data.region
+    try:
+        iids = await run_on(mutation_executor, run_instances, data, user_creds)
+    except Exception as e:
+        return error_response(
+            e, "Failed to launch instance. Check credentials, parameters, and limits."
+        )
+    inventory_syncer.mark_dirty(user_id, region)
+    instance_events.wake(user_creds, region)
+
+    async def results():
+        tracked = track_running(iids, user_creds, region=region)
+        try:
+            async for result in iterate_blocking(tracked, mutation_executor):
+                await record_results(user_id, region, result)
+                yield orjson.dumps(result) + b"\n"
+        except Exception as e:
+            message = "Lost track of the launched instances."
+            yield orjson.dumps({"error": str(e), "message": message}) + b"\n"
+
+    return StreamingResponse(results(), media_type=NDJSON)
+
+
+@router.post("/batch/{action}")
+async def batch_instances(
+    action: Literal["start", "stop", "terminate"],
+    data: InstanceBatchRequest,
+    run_async: Annotated[bool, Query(alias="async")] = False,
+    user_creds=Depends(get_current_creds),
+):
+    return await run_lifecycle(
+        run_async,
+        user_creds,
+        f"batch-{action}",
+        batch_instance_action,
+        action=action,
+        iids=data.instance_ids,
+    )
 
 
 @router.post("/{instance_id}/start")
-def start_instance(instance_id: str, user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    return start_ec2_instance(iid=instance_id, user=user_creds)
+async def start_instance(
+    instance_id: str,
+    run_async: Annotated[bool, Query(alias="async")] = False,
+    user_creds=Depends(get_current_creds),
+):
+    return await run_lifecycle(
+        run_async, user_creds, "start", start_ec2_instance, iid=instance_id
+    )
 
 
 @router.post("/{instance_id}/stop")
-def stop_instance(instance_id: str, user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    return stop_ec2_instance(iid=instance_id, user=user_creds)
+async def stop_instance(
+    instance_id: str,
+    run_async: Annotated[bool, Query(alias="async")] = False,
+    user_creds=Depends(get_current_creds),
+):
+    return await run_lifecycle(
+        run_async, user_creds, "stop", stop_ec2_instance, iid=instance_id
+    )
 
 
 @router.delete("/{instance_id}")
-def delete_instance(instance_id: str, user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    return terminate_ec2_instance(iid=instance_id, user=user_creds)
+async def delete_instance(
+    instance_id: str,
+    run_async: Annotated[bool, Query(alias="async")] = False,
+    user_creds=Depends(get_current_creds),
+):
+    return await run_lifecycle(
+        run_async, user_creds, "terminate", terminate_ec2_instance, iid=instance_id
+    )
 
 
 # KEY PAIR ROUTES
-@router.get("/keypair")
-def get_keypairs(user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    return get_all_keypairs(user=user_creds)
+@router.get("/keypair", response_model=KeyPairList)
+async def get_keypairs(
+    request: Request,
+    regions: str | None = None,
+    fields: str | None = None,
+    user_creds=Depends(get_current_creds),
+):
+    fields = parse_fields(fields, KeyPair)
+    if regions:
+        names = await resolve_regions(user_creds, regions)
+        results, errors = await fan_out(get_all_keypairs, user_creds, names)
+        response = {"key_pairs": merge_tagged(results, "key_pairs"), "errors": errors}
+    else:
+        response = await run_blocking(get_all_keypairs, user=user_creds)
+    return list_response(response, "key_pairs", fields, request)
 
 
 @router.post("/keypair")
-def create_keypair_download(data: KeyPairRequest, user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    return create_key_pair_as_file(data.key_name, user=user_creds)
+async def create_keypair_download(
+    data: KeyPairRequest, user_creds=Depends(get_current_creds)
+):
+    return await run_blocking(
+        create_key_pair_as_file, data.key_name, user=user_creds, region=data.region
+    )
 
 
 @router.delete("/keypair")
-def del_keypair(data: KeyPairRequest, user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    return delete_keypair(data.key_name, user=user_creds)
+async def del_keypair(data: KeyPairRequest, user_creds=Depends(get_current_creds)):
+    return await run_blocking(
+        delete_keypair, data.key_name, user=user_creds, region=data.region
+    )
 
 
 # SECURITY GROUP ROUTES
-@router.get("/security-group")
-def get_sg(user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    return get_security_groups(user=user_creds)
+@router.get("/security-group", response_model=SecurityGroupList)
+async def get_sg(
+    request: Request,
+    regions: str | None = None,
+    fields: str | None = None,
+    user_creds=Depends(get_current_creds),
+):
+    fields = parse_fields(fields, SecurityGroup)
+    if regions:
+        names = await resolve_regions(user_creds, regions)
+        results, errors = await fan_out(get_security_groups, user_creds, names)
+        response = {
+            "security_groups": merge_tagged(results, "security_groups"),
+            "errors": errors,
+        }
+    else:
+        response = await run_blocking(get_security_groups, user=user_creds)
+    return list_response(response, "security_groups", fields, request)
+
+
+@router.get("/security-group/exposure", response_model=ExposureReport)
+async def get_sg_exposure(
+    request: Request,
+    port: Annotated[int | None, Query(ge=0, le=65535)] = None,
+    protocol: Literal["tcp", "udp", "icmp", "icmpv6", "-1"] = "tcp",
+    cidr: Annotated[str | None, Query(pattern=r"^[0-9a-fA-F:.]+/\d{1,3}$")] = None,
+    direction: Literal["ingress", "egress"] = "ingress",
+    match: Literal["contains", "overlaps"] = "contains",
+    region: Annotated[str | None, Query(pattern=REGION_PATTERN.pattern)] = None,
+    user_creds=Depends(get_current_creds),
+):
+    """
+    Which groups let `protocol`/`port` through for `cidr`, e.g. 22/tcp from
+    0.0.0.0/0. `match=contains` wants a rule covering the whole CIDR,
+    `overlaps` any part of it.
+    """
+    if cidr:
+        try:
+            parse_network(cidr)
+        except ValueError:
+            raise HTTPException(status_code=422, detail=f"Invalid CIDR: {cidr}")
+    response = await run_blocking(
+        security_group_exposure,
+        user=user_creds,
+        direction=direction,
+        protocol=protocol,
+        port=port,
+        cidr=cidr,
+        overlaps=match == "overlaps",
+        region=region,
+    )
+    return list_response(response, "groups", request=request)
 
 
 @router.get("/security-group/{group_id}")
-def get_sg_rules(group_id: str, user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    return get_security_group_rules(gid=group_id, user=user_creds)
+async def get_sg_rules(group_id: str, user_creds=Depends(get_current_creds)):
+    return await run_blocking(get_security_group_rules, gid=group_id, user=user_creds)
+
+
+@router.put("/security-group/{group_id}/rules")
+async def sync_sg_rules(
+    group_id: str,
+    data: SecurityGroupRulesRequest,
+    user_creds=Depends(get_current_creds),
+):
+    return await run_blocking(
+        sync_security_group_rules, gid=group_id, rules=data.rules, user=user_creds
+    )
 
 
 @router.post("/security-group")
-def create_sg(data: SecurityGroupRequest, user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    return create_security_group(data, user=user_creds)
+async def create_sg(data: SecurityGroupRequest, user_creds=Depends(get_current_creds)):
+    return await run_blocking(create_security_group, data, user=user_creds)
 
 
 @router.delete("/security-group/{group_id}")
-def del_sg(group_id: str, user=Depends(get_current_user)):
-    user_creds = get_aws_creds(user=user)
-    return delete_security_group(gid=group_id, user=user_creds)
+async def del_sg(group_id: str, user_creds=Depends(get_current_creds)):
+    return await run_blocking(delete_security_group, gid=group_id, user=user_creds)
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.services.auth import get_current_creds
+from app.services.jobs import job_store
+
+router = APIRouter(prefix="/jobs")
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, user_creds=Depends(get_current_creds)):
+    job = job_store.get(job_id, owner=user_creds["user_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
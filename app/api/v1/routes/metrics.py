@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.services.executor import aws_executor, mutation_executor
+from app.services.governor import governor
+from app.services.jobs import job_store
+from app.services.metrics import observe_pool
+from app.services.waiters import waiter_service
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    observe_pool("aws", aws_executor)
+    observe_pool("mutation", mutation_executor)
+    observe_pool("jobs", job_store._executor)
+    governor.observe()
+    waiter_service.observe()
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
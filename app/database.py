@@ -1,17 +1,28 @@
 import os
-import motor.motor_asyncio
-from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI
-from fastapi.requests import Request
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from app.services.metrics import instrument_engine
 
 load_dotenv()
 
 DB_URL = os.getenv("DB_URL")
 
-engine = create_engine(DB_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(url: str):
+    """Maps a sync database URL onto the matching asyncio driver."""
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+engine = create_async_engine(async_url(DB_URL), pool_pre_ping=True)
+instrument_engine(engine.sync_engine)
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
@@ -1,13 +1,6 @@
-from typing import Annotated
-from fastapi.security import OAuth2PasswordBearer
-import jwt
 from app.database import SessionLocal
-from sqlalchemy.orm import Session
-from fastapi import Depends
 
-def get_db():
-    db = SessionLocal()
-    try:
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
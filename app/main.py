@@ -1,14 +1,68 @@
-from fastapi import FastAPI, APIRouter
-from app.api.v1.routes import instance, auth
+import math
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, Request
+from fastapi.responses import JSONResponse
+from app.api.v1.routes import instance, auth, jobs, admin, metrics
 from app.database import Base, engine
 from app.schemas import *
+from app.services.admission import AdmissionMiddleware
+from app.services.catalog import catalog_syncer
+from app.services.clients import prewarm
+from app.services.events import instance_events
+from app.services.executor import run_blocking
+from app.services.governor import RateLimited
+from app.services.inventory import inventory_syncer
+from app.services.metrics import MetricsMiddleware
+from app.services.profiling import ProfilingMiddleware
+from app.services.serialize import CompressionMiddleware
 
-app = FastAPI()
+INVENTORY_SYNC_ENABLED = os.getenv("INVENTORY_SYNC_ENABLED", "true") == "true"
+AMI_CATALOG_SYNC_ENABLED = os.getenv("AMI_CATALOG_SYNC_ENABLED", "true") == "true"
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+# Off where migrations own the schema; saves a round of DDL checks per worker.
+DB_CREATE_SCHEMA = os.getenv("DB_CREATE_SCHEMA", "true") == "true"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_CREATE_SCHEMA:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    # Workers take traffic as soon as startup ends; have the models ready.
+    await run_blocking(prewarm)
+    if INVENTORY_SYNC_ENABLED:
+        inventory_syncer.start()
+    if AMI_CATALOG_SYNC_ENABLED:
+        catalog_syncer.start()
+    yield
+    await inventory_syncer.stop()
+    await catalog_syncer.stop()
+    await instance_events.stop()
+    await engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CompressionMiddleware, minimum_size=GZIP_MIN_SIZE)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 app.include_router(instance.router)
 app.include_router(auth.router)
-Base.metadata.create_all(bind=engine)
+app.include_router(jobs.router)
+app.include_router(admin.router)
+app.include_router(metrics.router)
+
+
+@app.exception_handler(RateLimited)
+async def rate_limited(request: Request, exc: RateLimited):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
 
 
 @app.get("/")
-def home():
+async def home():
     return {"message": "Hello World"}
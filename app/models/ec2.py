@@ -1,9 +1,11 @@
-from pydantic import BaseModel, Field, constr
+from datetime import datetime
+from pydantic import BaseModel, Field, constr, model_validator
 from typing import Optional, Annotated
 
-InstanceId = Annotated[str, constr(pattern=r"^i-[a-f0-9]{8,}$")]
+InstanceId = Annotated[str, Field(pattern=r"^i-[a-f0-9]{8,}$")]
 AmiId = Annotated[str, constr(pattern=r"^ami-[a-f0-9]{8,}$")]
 SecurityGroupId = Annotated[str, constr(pattern=r"^sg-[a-f0-9]{8,}$")]
+SubnetId = Annotated[str, Field(pattern=r"^subnet-[a-f0-9]{8,}$")]
 KeyName = Annotated[str, constr(min_length=3, max_length=255, pattern=r"^[\w\-]+$")]
 GroupName = Annotated[str, constr(min_length=2, max_length=255)]
 Cidr = Annotated[str, Field(pattern=r"^(?:\d{1,3}\.){3}\d{1,3}/\d{1,2}$")]
@@ -15,11 +17,26 @@ class InstanceLaunchRequest(BaseModel):
     key_name: KeyName
     security_group_id: SecurityGroupId
     region: str = "ap-south-1"
+    count: Annotated[int, Field(ge=1, le=1000)] = 1
+    # Launch anyway if at least this many fit in capacity; defaults to `count`.
+    min_count: Optional[Annotated[int, Field(ge=1)]] = None
+    subnet_id: Optional[SubnetId] = None
+    tags: dict[str, str] = {}
+
+    @model_validator(mode="after")
+    def check_counts(self):
+        if self.min_count is not None and self.min_count > self.count:
+            raise ValueError("min_count can't exceed count")
+        return self
+
+
+class InstanceBatchRequest(BaseModel):
+    instance_ids: list[InstanceId] = Field(min_length=1)
 
 
 class KeyPairRequest(BaseModel):
     key_name: KeyName
-    region: str = "ap-south-1"
+    region: Optional[str] = None
 
 
 class Rule(BaseModel):
@@ -32,5 +49,116 @@ class SecurityGroupRequest(BaseModel):
     group_name: GroupName
     description: str
     vpc_id: Optional[str] = None
-    region: str = "ap-south-1"
+    region: Optional[str] = None
     rules: list[Rule] = []
+
+
+class SecurityGroupRulesRequest(BaseModel):
+    rules: list[Rule]
+
+
+# RESPONSE MODELS
+class Instance(BaseModel):
+    instance_id: str
+    state: str
+    instance_type: Optional[str] = None
+    image_id: Optional[str] = None
+    launch_time: Optional[datetime] = None
+    availability_zone: Optional[str] = None
+    vpc_id: Optional[str] = None
+    subnet_id: Optional[str] = None
+    public_ip: Optional[str] = None
+    private_ip: Optional[str] = None
+    key_name: Optional[str] = None
+    tags: dict[str, str] = {}
+    region: Optional[str] = None
+
+
+class InstanceList(BaseModel):
+    instances: list[Instance]
+    next_token: Optional[str] = None
+    last_synced_at: Optional[datetime] = None
+    errors: Optional[dict[str, str]] = None
+
+
+class Image(BaseModel):
+    image_id: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    architecture: Optional[str] = None
+    owner_id: Optional[str] = None
+    owner_alias: Optional[str] = None
+    creation_date: Optional[datetime] = None
+    virtualization_type: Optional[str] = None
+    root_device_type: Optional[str] = None
+    platform_details: Optional[str] = None
+    state: Optional[str] = None
+
+
+class ImageList(BaseModel):
+    images: list[Image]
+    next_token: Optional[str] = None
+    last_synced_at: Optional[datetime] = None
+
+
+class KeyPair(BaseModel):
+    key_name: str
+    key_pair_id: Optional[str] = None
+    key_type: Optional[str] = None
+    key_fingerprint: Optional[str] = None
+    create_time: Optional[datetime] = None
+    tags: dict[str, str] = {}
+    region: Optional[str] = None
+
+
+class KeyPairList(BaseModel):
+    key_pairs: list[KeyPair]
+    errors: Optional[dict[str, str]] = None
+
+
+class Permission(BaseModel):
+    protocol: str
+    from_port: Optional[int] = None
+    to_port: Optional[int] = None
+    cidrs: list[str] = []
+    group_ids: list[str] = []
+
+
+class SecurityGroup(BaseModel):
+    group_id: str
+    group_name: str
+    description: Optional[str] = None
+    vpc_id: Optional[str] = None
+    ingress: list[Permission] = []
+    egress: list[Permission] = []
+    tags: dict[str, str] = {}
+    region: Optional[str] = None
+
+
+class SecurityGroupList(BaseModel):
+    security_groups: list[SecurityGroup]
+    errors: Optional[dict[str, str]] = None
+
+
+class SecurityGroupRule(BaseModel):
+    rule_id: str
+    group_id: str
+    direction: str
+    protocol: str
+    from_port: Optional[int] = None
+    to_port: Optional[int] = None
+    cidr: Optional[str] = None
+    referenced_group_id: Optional[str] = None
+    prefix_list_id: Optional[str] = None
+    description: Optional[str] = None
+
+
+class GroupExposure(BaseModel):
+    group_id: str
+    rules: list[SecurityGroupRule]
+
+
+class ExposureReport(BaseModel):
+    groups: list[GroupExposure]
+    rules_indexed: int
+    indexed_at: datetime
@@ -0,0 +1,41 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String
+from app.database import Base
+
+
+class AMI_Image(Base):
+    __tablename__ = "images"
+
+    region = Column(String, primary_key=True)
+    image_id = Column(String, primary_key=True)
+    name = Column(String)
+    description = Column(String)
+    architecture = Column(String)
+    owner_id = Column(String)
+    owner_alias = Column(String)
+    creation_date = Column(DateTime(timezone=True))
+    virtualization_type = Column(String)
+    root_device_type = Column(String)
+    platform_details = Column(String)
+    state = Column(String)
+
+    __table_args__ = (
+        Index("ix_images_region_name", "region", "name"),
+        Index("ix_images_region_created", "region", "creation_date"),
+        Index("ix_images_region_arch", "region", "architecture", "creation_date"),
+        Index("ix_images_region_owner", "region", "owner_id", "creation_date"),
+        Index(
+            "ix_images_region_virt", "region", "virtualization_type", "creation_date"
+        ),
+    )
+
+
+class Catalog_Sync(Base):
+    __tablename__ = "image_catalog_syncs"
+
+    region = Column(String, primary_key=True)
+    # Account whose credentials refresh the region in the background.
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
+    watermark = Column(DateTime(timezone=True))
+    last_synced_at = Column(DateTime(timezone=True), nullable=False)
+    last_full_sync_at = Column(DateTime(timezone=True), nullable=False)
+    image_count = Column(Integer, default=0, nullable=False)
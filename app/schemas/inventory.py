@@ -0,0 +1,43 @@
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, Index, Integer, String
+from app.database import Base
+
+
+class EC2_Instance(Base):
+    __tablename__ = "instances"
+
+    # Several registered users may hold keys for the same AWS account, so
+    # each keeps its own copy of the account's instances.
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    instance_id = Column(String, primary_key=True)
+    region = Column(String, nullable=False)
+    state = Column(String, nullable=False)
+    instance_type = Column(String)
+    image_id = Column(String)
+    launch_time = Column(DateTime(timezone=True))
+    availability_zone = Column(String)
+    vpc_id = Column(String)
+    subnet_id = Column(String)
+    public_ip = Column(String)
+    private_ip = Column(String)
+    key_name = Column(String)
+    tags = Column(JSON, default=dict)
+    last_synced_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_instances_account_state", "user_id", "region", "state"),
+        Index("ix_instances_account_type", "user_id", "region", "instance_type"),
+        Index("ix_instances_account_launch", "user_id", "region", "launch_time"),
+    )
+
+
+class Inventory_Sync(Base):
+    __tablename__ = "inventory_syncs"
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    region = Column(String, primary_key=True)
+    last_synced_at = Column(DateTime(timezone=True), nullable=False)
+    transitional = Column(Integer, default=0, nullable=False)
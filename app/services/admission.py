@@ -0,0 +1,189 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, deque
+
+import jwt
+from fastapi.responses import JSONResponse
+
+from app.services.metrics import (
+    ADMISSION_QUEUED,
+    ADMISSION_REJECTED,
+    ADMISSION_RUNNING,
+    ADMISSION_WAIT,
+)
+
+# Same settings as app.services.auth, which can't be imported this early.
+SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+ALGORITHM = "HS256"
+
+READ_METHODS = {"GET", "HEAD"}
+# Long-lived streams would pin a slot for as long as the client listens.
+UNMETERED_SUFFIXES = ("/events",)
+
+
+class Overloaded(Exception):
+    def __init__(self, pool: str, status: int, reason: str, retry_after: float):
+        self.pool = pool
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"Too many {pool} requests ({reason}), retry later")
+
+
+class AdmissionPool:
+    """
+    Caps how many requests of one kind run at once, globally and per
+    account. Requests over the global cap wait in a bounded FIFO queue for
+    up to `timeout` seconds; a full queue or an expired wait is a 503, an
+    account over its own cap a 429.
+    """
+
+    def __init__(
+        self, name: str, limit: int, per_account: int, queue: int, timeout: float
+    ):
+        self.name = name
+        self.limit = limit
+        self.per_account = per_account
+        self.queue = queue
+        self.timeout = timeout
+        self.running = 0
+        self._waiters = deque()
+        self._accounts = Counter()
+        # Moving average of how long a slot is held, for Retry-After.
+        self._hold = 1.0
+
+    def _retry_after(self, ahead: int):
+        return max(1, math.ceil(self._hold * (ahead + 1) / self.limit))
+
+    def _reject(self, status: int, reason: str, retry_after: float):
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        raise Overloaded(self.name, status, reason, retry_after)
+
+    def _observe(self):
+        ADMISSION_RUNNING.labels(self.name).set(self.running)
+        ADMISSION_QUEUED.labels(self.name).set(len(self._waiters))
+
+    async def acquire(self, account: str):
+        if self._accounts[account] >= self.per_account:
+            self._reject(429, "account", max(1, math.ceil(self._hold)))
+
+        if self.running < self.limit and not self._waiters:
+            self.running += 1
+        elif len(self._waiters) >= self.queue:
+            self._reject(503, "queue_full", self._retry_after(len(self._waiters)))
+        else:
+            started = time.monotonic()
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self._accounts[account] += 1
+            self._observe()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+            except BaseException as e:
+                self._accounts[account] -= 1
+                if waiter.done():
+                    # Handed a slot just as the wait ended; pass it on.
+                    self._release()
+                else:
+                    waiter.cancel()
+                    self._waiters.remove(waiter)
+                self._observe()
+                if isinstance(e, asyncio.TimeoutError):
+                    self._reject(503, "timeout", self._retry_after(len(self._waiters)))
+                raise
+            finally:
+                ADMISSION_WAIT.labels(self.name).observe(time.monotonic() - started)
+            return
+
+        self._accounts[account] += 1
+        self._observe()
+
+    def release(self, account: str, held: float):
+        self._hold = 0.9 * self._hold + 0.1 * held
+        self._accounts[account] -= 1
+        if not self._accounts[account]:
+            del self._accounts[account]
+        self._release()
+        self._observe()
+
+    def _release(self):
+        # The slot goes straight to the oldest waiter, so running stays put.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.running -= 1
+
+
+def _pool(name: str, limit: int, per_account: int, queue: int, timeout: float):
+    prefix = f"ADMISSION_{name.upper()}"
+    return AdmissionPool(
+        name,
+        limit=int(os.getenv(f"{prefix}_LIMIT", limit)),
+        per_account=int(os.getenv(f"{prefix}_PER_ACCOUNT", per_account)),
+        queue=int(os.getenv(f"{prefix}_QUEUE", queue)),
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT_SECONDS", timeout)),
+    )
+
+
+# Reads stay under the AWS executor's size, leaving threads for background
+# syncs; mutations, which can block on waiters, have their own executor.
+read_pool = _pool("read", limit=48, per_account=16, queue=256, timeout=5)
+mutate_pool = _pool("mutate", limit=32, per_account=8, queue=128, timeout=30)
+
+
+def _account(headers: list):
+    """The token's subject, or None to let the route reject the request."""
+    for name, value in headers:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return None
+            try:
+                return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])["sub"]
+            except Exception:
+                return None
+    return None
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting /instances requests through `read_pool` or
+    `mutate_pool` by method, so requests piling up on waiters can't take
+    the threads cheap reads need. Other routes are never queued.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or not path.startswith("/instances")
+            or path.rstrip("/").endswith(UNMETERED_SUFFIXES)
+        ):
+            return await self.app(scope, receive, send)
+        account = _account(scope["headers"])
+        if account is None:
+            return await self.app(scope, receive, send)
+
+        pool = read_pool if scope["method"] in READ_METHODS else mutate_pool
+        try:
+            await pool.acquire(account)
+        except Overloaded as e:
+            response = JSONResponse(
+                status_code=e.status,
+                content={"detail": str(e)},
+                headers={"Retry-After": str(math.ceil(e.retry_after))},
+            )
+            return await response(scope, receive, send)
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release(account, time.monotonic() - started)
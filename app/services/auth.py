@@ -1,29 +1,63 @@
+import asyncio
+import functools
 import hashlib
+import hmac
 import os
 from typing import Annotated
 
-from fastapi import Depends, HTTPException
+from fastapi import (
+    Depends,
+    Header,
+    HTTPException,
+    WebSocket,
+    WebSocketException,
+    status,
+)
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 import jwt
 from jwt import PyJWTError
 from datetime import datetime, timedelta, timezone
 from cryptography.fernet import Fernet
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.deps import get_db
 from app.schemas.auth_request import AWS_User
-
+from app.services.cache import SQLiteBackend, make_cache
+from app.services.executor import aws_executor, run_blocking
+from app.services.profiling import span
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
 REFRESH_TOKEN_EXPIRE_DAYS = os.getenv("REFRESH_TOKEN_EXPIRE_DAYS")
 FERNET_KEY = os.getenv("FERNET_SECRET_KEY")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
-fernet = Fernet(FERNET_KEY)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/register")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Decrypted credentials per user id. Secrets only ever live in this process's
+# memory; entries are dropped, in every worker, whenever the user row changes
+# or is deleted.
+principal_cache = make_cache(
+    "principals",
+    share_values=False,
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300")),
+)
+
+
+def _shared_principals():
+    # On the shared file a cache call can wait seconds on another worker's
+    # write lock; that mustn't happen on the event loop.
+    return isinstance(principal_cache.backend, SQLiteBackend)
+
+
+async def _principal_cache_call(method: str, *args):
+    call = getattr(principal_cache, method)
+    if _shared_principals():
+        return await run_blocking(call, *args)
+    return call(*args)
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
@@ -55,9 +89,14 @@ def decode_access_token(token: str):
         raise ValueError("Invalid token")
 
 
-def get_current_user(
+async def get_user(db: AsyncSession, user_id) -> AWS_User | None:
+    result = await db.execute(select(AWS_User).where(AWS_User.id == int(user_id)))
+    return result.scalar_one_or_none()
+
+
+async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
-    db: Annotated[Session, Depends(get_db)],
+    db: Annotated[AsyncSession, Depends(get_db)],
 ):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -65,7 +104,7 @@ def get_current_user(
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
 
-        user = db.query(AWS_User).filter(AWS_User.id == user_id).first()
+        user = await get_user(db, user_id)
 
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -74,18 +113,120 @@ def get_current_user(
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
 
+def get_aws_creds(user: AWS_User):
+    _access_key, _secret_key = decrypt_aws_creds(user.access_key, user.access_secret)
+    return dict(
+        access_key=_access_key,
+        secret_key=_secret_key,
+        region=user.region,
+        fingerprint=user.aws_fp,
+        user_id=user.id,
+    )
+
+
+async def get_current_creds(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: Annotated[AsyncSession, Depends(get_db)],
+):
+    """
+    Resolves the bearer token to the caller's decrypted AWS credentials,
+    skipping the user query and Fernet decryption while the principal is cached.
+    """
+    try:
+        with span("auth"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        user_id = payload.get("sub")
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        creds = await _principal_cache_call("get", user_id)
+        if creds is not None:
+            return creds
+
+        # An invalidation landing while the row is read must win over it.
+        version = await _principal_cache_call("version", user_id)
+        user = await get_user(db, user_id)
+
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        creds = get_aws_creds(user)
+        await _principal_cache_call("set", user_id, creds, version)
+        return creds
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+
+async def get_websocket_creds(
+    websocket: WebSocket,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    token: str | None = None,
+):
+    """
+    WebSocket counterpart of get_current_creds. Browsers can't set headers on
+    a WebSocket handshake, so the token may also be passed as `?token=`.
+    """
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        token = credentials
+    if not token:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+    try:
+        return await get_current_creds(token, db)
+    except HTTPException:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+
+
+def invalidate_principal(user_id):
+    principal_cache.delete(str(user_id))
+
+
+async def invalidate_principal_async(user_id):
+    await _principal_cache_call("delete", str(user_id))
+
+
+@event.listens_for(AWS_User, "after_update")
+@event.listens_for(AWS_User, "after_delete")
+def _invalidate_changed_principal(mapper, connection, target):
+    # Bulk Query.update()/delete() bypass mapper events; use
+    # invalidate_principal() explicitly there.
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is None or not _shared_principals():
+        invalidate_principal(target.id)
+    else:
+        # An AsyncSession flushes on the event loop; callers that need the
+        # invalidation done before they go on await invalidate_principal_async.
+        loop.run_in_executor(aws_executor, invalidate_principal, target.id)
+
+
+def require_admin(x_admin_token: Annotated[str | None, Header()] = None):
+    if not ADMIN_TOKEN or not x_admin_token:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+
+@functools.cache
+def get_fernet():
+    return Fernet(FERNET_KEY)
+
+
 def encrypt_aws_creds(access_key: str, access_secret: str):
     return (
-        fernet.encrypt(access_key.encode()).decode(),
-        fernet.encrypt(access_secret.encode()).decode(),
+        get_fernet().encrypt(access_key.encode()).decode(),
+        get_fernet().encrypt(access_secret.encode()).decode(),
     )
 
 
 def decrypt_aws_creds(enc_key: str, enc_secret: str):
-    return (
-        fernet.decrypt(enc_key.encode()).decode(),
-        fernet.decrypt(enc_secret.encode()).decode(),
-    )
+    with span("decrypt"):
+        return (
+            get_fernet().decrypt(enc_key.encode()).decode(),
+            get_fernet().decrypt(enc_secret.encode()).decode(),
+        )
 
 
 def get_aws_fingerprint(access_key: str, access_secret: str):
@@ -0,0 +1,350 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import orjson
+
+# "memory" keeps every cache in its own worker; "sqlite" shares them between
+# the worker processes on a host through the file at CACHE_PATH.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv(
+    "CACHE_PATH", os.path.join(tempfile.gettempdir(), "nimbly-cache.sqlite3")
+)
+# Invalidation markers older than this are swept from the shared file.
+CACHE_TOMBSTONE_SECONDS = float(os.getenv("CACHE_TOMBSTONE_SECONDS", "3600"))
+SWEEP_EVERY = 256
+
+_refresher = ThreadPoolExecutor(max_workers=4, thread_name_prefix="nimbly-refresh")
+
+
+class MemoryBackend:
+    """
+    In-process LRU of (value, stored_at) pairs. Any invalidation bumps one
+    generation counter, which is the version `put` checks against.
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def version(self, key):
+        return self._generation
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, value, version=None):
+        if version is not None and version != self._generation:
+            return
+        self._entries[key] = (value, self.clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+        self._generation += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._generation += 1
+
+
+class SQLiteBackend:
+    """
+    Entries in a SQLite file shared by every worker process on the host.
+
+    Each key has a version in the file that delete() bumps, and clear()
+    bumps the namespace's version under the reserved key "*". A load only
+    stores its result if neither moved while it ran, so an invalidation in
+    any worker wins over a slow load in another.
+
+    With `share_values=False` values stay in this process and only versions
+    go to the file, for secrets that must not touch disk; a local entry is
+    served only while its versions are current.
+    """
+
+    clock = staticmethod(time.time)
+    ALL = "*"
+
+    def __init__(
+        self,
+        namespace: str,
+        maxsize: int = 1024,
+        path: str = CACHE_PATH,
+        share_values: bool = True,
+    ):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.share_values = share_values
+        self._local = OrderedDict()
+        self._writes = 0
+        self._conn = _connect(path)
+
+    def __len__(self):
+        if not self.share_values:
+            return len(self._local)
+        return self._conn.execute(
+            "SELECT count(*) FROM cache_entries"
+            " WHERE namespace = ? AND key != ? AND value IS NOT NULL",
+            (self.namespace, self.ALL),
+        ).fetchone()[0]
+
+    def _read(self, key: str):
+        rows = self._conn.execute(
+            "SELECT key, version, value, stored_at FROM cache_entries"
+            " WHERE namespace = ? AND key IN (?, ?)",
+            (self.namespace, self.ALL, key),
+        ).fetchall()
+        version, entry = [0, 0], None
+        for k, v, value, stored_at in rows:
+            if k == self.ALL:
+                version[0] = v
+            else:
+                version[1] = v
+                entry = (value, stored_at)
+        return tuple(version), entry
+
+    def version(self, key):
+        return self._read(_encode(key))[0]
+
+    def get(self, key):
+        key = _encode(key)
+        version, entry = self._read(key)
+        if not self.share_values:
+            local = self._local.get(key)
+            if local is None or local[2] != version:
+                return None
+            self._local.move_to_end(key)
+            return local[:2]
+        if entry is None or entry[0] is None:
+            return None
+        return orjson.loads(entry[0]), entry[1]
+
+    def put(self, key, value, version=None):
+        key, now = _encode(key), self.clock()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            current, _ = self._read(key)
+            if version is not None and version != current:
+                return
+            if self.share_values:
+                self._conn.execute(
+                    "INSERT INTO cache_entries VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT (namespace, key) DO UPDATE"
+                    " SET value = excluded.value, stored_at = excluded.stored_at",
+                    (self.namespace, key, current[1], orjson.dumps(value), now),
+                )
+        finally:
+            self._conn.execute("COMMIT")
+
+        if not self.share_values:
+            self._local[key] = (value, now, current)
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+            return
+        self._writes += 1
+        if self._writes % SWEEP_EVERY == 0:
+            self._sweep()
+
+    def delete(self, key):
+        key = _encode(key)
+        self._local.pop(key, None)
+        self._bump(key)
+
+    def clear(self):
+        self._local.clear()
+        self._bump(self.ALL)
+        self._conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key != ?"
+            " AND value IS NOT NULL",
+            (self.namespace, self.ALL),
+        )
+
+    def _bump(self, key: str):
+        self._conn.execute(
+            "INSERT INTO cache_entries VALUES (?, ?, 1, NULL, ?)"
+            " ON CONFLICT (namespace, key) DO UPDATE"
+            " SET version = version + 1, value = NULL, stored_at = excluded.stored_at",
+            (self.namespace, key, self.clock()),
+        )
+
+    def _sweep(self):
+        # Keep the newest `maxsize` values and recent invalidation markers.
+        self._conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key != ? AND ("
+            " (value IS NULL AND stored_at < ?) OR (value IS NOT NULL AND rowid IN ("
+            "  SELECT rowid FROM cache_entries WHERE namespace = ?"
+            "  AND value IS NOT NULL ORDER BY stored_at DESC LIMIT -1 OFFSET ?)))",
+            (
+                self.namespace,
+                self.ALL,
+                self.clock() - CACHE_TOMBSTONE_SECONDS,
+                self.namespace,
+                self.maxsize,
+            ),
+        )
+
+
+def _encode(key):
+    return orjson.dumps(key).decode()
+
+
+def _connect(path: str):
+    # Cached values may be account data; keep the file private to this user.
+    os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+    conn = sqlite3.connect(
+        path, timeout=5, isolation_level=None, check_same_thread=False
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache_entries ("
+        " namespace TEXT NOT NULL, key TEXT NOT NULL, version INTEGER NOT NULL,"
+        " value BLOB, stored_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+    )
+    return conn
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire `ttl` seconds after being set.
+
+    `get_or_load` adds two things on top of plain get/set:
+
+    - concurrent misses for the same key share a single call to the loader;
+    - entries younger than `ttl + stale_ttl` are served stale while one
+      background refresh fetches a fresh value.
+
+    Entries live in `backend`, in-process memory unless given another.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60,
+        stale_ttl: float = 0,
+        backend=None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.backend = MemoryBackend(maxsize) if backend is None else backend
+        self.hits = 0
+        self.misses = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self.backend.get(key)
+            if entry is None or self.backend.clock() - entry[1] >= self.ttl:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def version(self, key):
+        """A token to pass to `set` so it skips values invalidated meanwhile."""
+        with self._lock:
+            return self.backend.version(key)
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            self.backend.put(key, value, version)
+
+    def delete(self, key):
+        with self._lock:
+            self.backend.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self.backend.clear()
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self.backend.get(key)
+            if entry is not None:
+                age = self.backend.clock() - entry[1]
+                if age < self.ttl:
+                    self.hits += 1
+                    return entry[0]
+                if age < self.ttl + self.stale_ttl:
+                    self.hits += 1
+                    if key not in self._inflight:
+                        self._inflight[key] = Future()
+                        version = self.backend.version(key)
+                        _refresher.submit(self._load, key, loader, version)
+                    return entry[0]
+
+            self.misses += 1
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                version = self.backend.version(key)
+
+        if owner:
+            self._load(key, loader, version)
+        return future.result()
+
+    def _load(self, key, loader, version):
+        future = self._inflight[key]
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            return
+
+        with self._lock:
+            try:
+                # Don't resurrect data that was invalidated while it was being fetched.
+                self.backend.put(key, value, version)
+            except Exception:
+                # A value that couldn't be cached is still the caller's answer.
+                pass
+            finally:
+                del self._inflight[key]
+        future.set_result(value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self.backend),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def make_cache(
+    namespace: str,
+    maxsize: int = 1024,
+    ttl: float = 60,
+    stale_ttl: float = 0,
+    share_values: bool = True,
+):
+    """
+    A TTLCache on the configured CACHE_BACKEND. On "sqlite", entries and
+    invalidations are seen by every worker; `share_values=False` shares only
+    the invalidations.
+    """
+    backend = None
+    if CACHE_BACKEND == "sqlite":
+        backend = SQLiteBackend(namespace, maxsize, CACHE_PATH, share_values)
+    return TTLCache(maxsize, ttl, stale_ttl, backend=backend)
@@ -0,0 +1,280 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import SessionLocal
+from app.schemas.auth_request import AWS_User
+from app.schemas.catalog import AMI_Image, Catalog_Sync
+from app.services.auth import get_aws_creds
+from app.services.executor import run_blocking
+from app.services.fanout import resolve_regions
+from app.services.manager import iter_catalog_images
+from app.services.periodic import PeriodicTask, sync_failed, sync_lock
+from app.services.serialize import aware, parse_offset
+
+AMI_CATALOG_SYNC_INTERVAL = float(os.getenv("AMI_CATALOG_SYNC_SECONDS", "3600"))
+# Full syncs also drop images that were deregistered since the last one.
+AMI_CATALOG_FULL_SYNC_INTERVAL = float(
+    os.getenv("AMI_CATALOG_FULL_SYNC_SECONDS", "86400")
+)
+# Seconds a client is told to wait while a region's first sync runs.
+AMI_CATALOG_FIRST_SYNC_RETRY_AFTER = int(
+    os.getenv("AMI_CATALOG_FIRST_SYNC_RETRY_AFTER_SECONDS", "30")
+)
+WRITE_CHUNK_SIZE = 500
+
+CATALOG_FIELDS = (
+    "name",
+    "description",
+    "architecture",
+    "owner_id",
+    "owner_alias",
+    "creation_date",
+    "virtualization_type",
+    "root_device_type",
+    "platform_details",
+    "state",
+)
+
+SORT_COLUMNS = {
+    "creation_date": AMI_Image.creation_date,
+    "name": AMI_Image.name,
+}
+
+
+def _row_values(region: str, image: dict):
+    values = {field: image.get(field) for field in CATALOG_FIELDS}
+    if values["creation_date"]:
+        values["creation_date"] = datetime.fromisoformat(values["creation_date"])
+    return dict(values, region=region, image_id=image["image_id"])
+
+
+def _as_dict(row: AMI_Image):
+    image = {"image_id": row.image_id}
+    image.update({field: getattr(row, field) for field in CATALOG_FIELDS})
+    if image["creation_date"]:
+        image["creation_date"] = aware(image["creation_date"]).isoformat()
+    return image
+
+
+def _chunks(items: list, size: int = WRITE_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+async def sync_region(db: AsyncSession, user: dict, region: str, full: bool = False):
+    """
+    Refreshes the region's catalog. Fetches only images created since the
+    watermark, the newest creation date seen so far, unless a full sync is
+    asked for or due. Returns how many images were fetched.
+    """
+    async with sync_lock("catalog", region):
+        return await _sync_region(db, user, region, full)
+
+
+async def _sync_region(db: AsyncSession, user: dict, region: str, full: bool):
+    now = datetime.now(timezone.utc)
+    sync = await db.get(Catalog_Sync, region)
+    if sync is None or sync.watermark is None:
+        full = True
+    elif (now - aware(sync.last_full_sync_at)).total_seconds() >= (
+        AMI_CATALOG_FULL_SYNC_INTERVAL
+    ):
+        full = True
+    since = None if full else aware(sync.watermark)
+
+    fetched = await run_blocking(
+        lambda: list(iter_catalog_images(user, region, since=since))
+    )
+    rows = [_row_values(region, image) for image in fetched]
+    if since:
+        # The month-wide filter overshoots; keep only what's new.
+        rows = [r for r in rows if r["creation_date"] and r["creation_date"] >= since]
+
+    if full:
+        await db.execute(delete(AMI_Image).where(AMI_Image.region == region))
+    else:
+        for ids in _chunks([r["image_id"] for r in rows]):
+            await db.execute(
+                delete(AMI_Image).where(
+                    AMI_Image.region == region, AMI_Image.image_id.in_(ids)
+                )
+            )
+    for chunk in _chunks(rows):
+        await db.execute(insert(AMI_Image), chunk)
+
+    dates = [r["creation_date"] for r in rows if r["creation_date"]]
+    watermark = max(dates, default=since)
+    count = await db.scalar(
+        select(func.count()).select_from(AMI_Image).where(AMI_Image.region == region)
+    )
+    await db.merge(
+        Catalog_Sync(
+            region=region,
+            user_id=user["user_id"],
+            watermark=watermark,
+            last_synced_at=now,
+            last_full_sync_at=now if full else sync.last_full_sync_at,
+            image_count=count,
+        )
+    )
+    await db.commit()
+    return len(rows)
+
+
+async def list_catalog_images(
+    db: AsyncSession,
+    user: dict,
+    region: str = None,
+    name: str = None,
+    architecture: str = None,
+    owner: str = None,
+    virtualization_type: str = None,
+    created_after: datetime = None,
+    created_before: datetime = None,
+    sort: str = "-creation_date",
+    limit: int = 100,
+    next_token: str = None,
+    latest: bool = False,
+):
+    """
+    Searches the local image catalog without calling AWS. A region must be
+    enabled for the account; one that has never been synced is answered
+    with a 503 while its first sync runs in the background.
+    `name` matches as a prefix and `owner` is an account ID or alias.
+    `latest` returns only the newest match.
+    """
+    offset = parse_offset(next_token)
+    region = region or user["region"]
+    if region != user["region"] and region not in await resolve_regions(user, "all"):
+        raise HTTPException(
+            status_code=422, detail=f"Region not enabled for the account: {region}"
+        )
+    sync = await db.get(Catalog_Sync, region)
+    if sync is None:
+        catalog_syncer.first_sync(user, region)
+        raise HTTPException(
+            status_code=503,
+            detail=f"The image catalog for {region} is being built, retry later",
+            headers={"Retry-After": str(AMI_CATALOG_FIRST_SYNC_RETRY_AFTER)},
+        )
+
+    query = select(AMI_Image).where(AMI_Image.region == region)
+    if name:
+        # A range rather than LIKE, so the (region, name) index is used.
+        query = query.where(AMI_Image.name >= name, AMI_Image.name < name + "\uffff")
+    if architecture:
+        query = query.where(AMI_Image.architecture == architecture)
+    if owner:
+        column = AMI_Image.owner_id if owner.isdigit() else AMI_Image.owner_alias
+        query = query.where(column == owner)
+    if virtualization_type:
+        query = query.where(AMI_Image.virtualization_type == virtualization_type)
+    if created_after:
+        query = query.where(AMI_Image.creation_date >= created_after)
+    if created_before:
+        query = query.where(AMI_Image.creation_date < created_before)
+
+    if latest:
+        sort, limit, next_token = "-creation_date", 1, None
+    column = SORT_COLUMNS[sort.lstrip("-")]
+    order = column.desc() if sort.startswith("-") else column.asc()
+    query = query.order_by(order, AMI_Image.image_id).offset(offset).limit(limit + 1)
+
+    rows = (await db.execute(query)).scalars().all()
+    more = not latest and len(rows) > limit
+
+    return {
+        "images": [_as_dict(row) for row in rows[:limit]],
+        "next_token": str(offset + limit) if more else None,
+        "last_synced_at": aware(sync.last_synced_at).isoformat(),
+    }
+
+
+async def _first_sync(db: AsyncSession, user: dict, region: str):
+    # A region's first sync fetches every image its owners have; skip it if
+    # one landed since the caller looked.
+    async with sync_lock("catalog", region):
+        sync = await db.get(Catalog_Sync, region)
+        if sync is not None:
+            return sync
+        try:
+            await _sync_region(db, user, region, full=True)
+        except IntegrityError:
+            # Another worker's sync of the region committed first.
+            await db.rollback()
+            sync = await db.get(Catalog_Sync, region)
+            if sync is None:
+                raise
+            return sync
+        return await db.get(Catalog_Sync, region)
+
+
+class CatalogSyncer(PeriodicTask):
+    """
+    Background task refreshing every region that has a catalog, with the
+    credentials of the account that last synced it.
+    """
+
+    def __init__(self):
+        super().__init__("catalog", min(AMI_CATALOG_SYNC_INTERVAL, 60))
+        self._stale = set()
+        self._first_syncs = {}
+
+    def first_sync(self, user: dict, region: str):
+        """Starts the region's first sync unless it's running; returns its task."""
+        task = self._first_syncs.get(region)
+        if task is None:
+            task = self._first_syncs[region] = asyncio.create_task(
+                self._first_sync(user, region)
+            )
+            task.add_done_callback(lambda _: self._first_syncs.pop(region, None))
+        return task
+
+    async def stop(self):
+        for task in list(self._first_syncs.values()):
+            task.cancel()
+        await super().stop()
+
+    async def _first_sync(self, user: dict, region: str):
+        try:
+            async with SessionLocal() as db:
+                await _first_sync(db, user, region)
+        except Exception:
+            sync_failed(self.name, region)
+
+    def mark_stale(self, region: str = None):
+        """Schedules a full sync of `region`, or of every region, on the next tick."""
+        self._stale.add(region)
+
+    async def tick(self):
+        await self.sync_due()
+
+    async def sync_due(self):
+        async with SessionLocal() as db:
+            syncs = (await db.execute(select(Catalog_Sync))).scalars().all()
+            users = {u.id: u for u in (await db.execute(select(AWS_User))).scalars()}
+
+        now = datetime.now(timezone.utc)
+        stale, self._stale = self._stale, set()
+        for sync in syncs:
+            full = None in stale or sync.region in stale
+            age = (now - aware(sync.last_synced_at)).total_seconds()
+            if sync.user_id not in users or not (
+                full or age >= AMI_CATALOG_SYNC_INTERVAL
+            ):
+                continue
+            try:
+                async with SessionLocal() as db:
+                    creds = get_aws_creds(users[sync.user_id])
+                    await sync_region(db, creds, sync.region, full=full)
+            except Exception:
+                sync_failed(self.name, sync.region)
+
+
+catalog_syncer = CatalogSyncer()
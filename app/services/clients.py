@@ -0,0 +1,209 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import botocore.loaders
+import botocore.session
+from botocore.config import Config
+from botocore.exceptions import DataNotFoundError
+
+from app.services.cache import make_cache
+from app.services.governor import governor
+from app.services.metrics import instrument_client
+from app.services.profiling import span
+
+CLIENT_POOL_SIZE = int(os.getenv("AWS_CLIENT_POOL_SIZE", "256"))
+CLIENT_TTL_SECONDS = float(os.getenv("AWS_CLIENT_TTL_SECONDS", "900"))
+# A key's account never changes; the TTL only bounds how long a deleted
+# key's entry lingers.
+ACCOUNT_ID_TTL_SECONDS = float(os.getenv("AWS_ACCOUNT_ID_TTL_SECONDS", "86400"))
+# How long a failed account lookup is remembered before STS is asked again.
+ACCOUNT_ID_RETRY_SECONDS = float(os.getenv("AWS_ACCOUNT_ID_RETRY_SECONDS", "60"))
+AWS_PREWARM_SERVICES = [
+    s for s in os.getenv("AWS_PREWARM_SERVICES", "ec2,sts").split(",") if s
+]
+
+# Adaptive mode retries throttled calls with jittered exponential backoff and
+# slows the client's own send rate while AWS keeps throttling it.
+CLIENT_CONFIG = Config(
+    retries={
+        "mode": os.getenv("AWS_RETRY_MODE", "adaptive"),
+        "max_attempts": int(os.getenv("AWS_MAX_ATTEMPTS", "5")),
+    }
+)
+
+# Error codes AWS returns once an access key has been deactivated, deleted or
+# rotated away. A pooled client holding such a key is useless from then on.
+INVALID_CREDENTIAL_CODES = {
+    "AuthFailure",
+    "InvalidClientTokenId",
+    "SignatureDoesNotMatch",
+    "UnrecognizedClientException",
+    "ExpiredToken",
+}
+
+
+# One loader for every session. botocore caches parsed models on the loader,
+# so each service's JSON (several MB for EC2) is read and parsed once per
+# process instead of once per pooled client.
+loader = botocore.loaders.create_loader()
+
+
+def new_session():
+    session = botocore.session.get_session()
+    session.register_component("data_loader", loader)
+    return session
+
+
+def prewarm(services: list[str] = AWS_PREWARM_SERVICES):
+    """
+    Loads the service, paginator and waiter models and endpoint rules for
+    `services` into the shared loader, so the first request doesn't pay for it.
+    """
+    session = new_session()
+    for service in services:
+        session.create_client(
+            service,
+            region_name="us-east-1",
+            aws_access_key_id="prewarm",
+            aws_secret_access_key="prewarm",
+        )
+        for type_name in ("paginators-1", "waiters-2"):
+            try:
+                loader.load_service_model(service, type_name)
+            except DataNotFoundError:
+                pass
+
+
+def credential_fingerprint(user: dict):
+    fp = user.get("fingerprint")
+    if fp:
+        return fp
+    return hashlib.sha256(
+        f"{user['access_key']}:{user['secret_key']}".encode()
+    ).hexdigest()
+
+
+account_ids = make_cache(
+    "account_ids", maxsize=CLIENT_POOL_SIZE, ttl=ACCOUNT_ID_TTL_SECONDS
+)
+failed_account_ids = make_cache(
+    "failed_account_ids", maxsize=CLIENT_POOL_SIZE, ttl=ACCOUNT_ID_RETRY_SECONDS
+)
+
+
+def account_id(user: dict):
+    """
+    The AWS account the user's key belongs to, looked up once with
+    get_caller_identity. Falls back to the credential fingerprint while the
+    lookup fails, so the key still gets a budget of its own; a failure is
+    retried after ACCOUNT_ID_RETRY_SECONDS rather than on every call.
+    """
+    fingerprint = credential_fingerprint(user)
+    if failed_account_ids.get(fingerprint):
+        return fingerprint
+
+    def load():
+        return get_client(user, service="sts").get_caller_identity()["Account"]
+
+    try:
+        return account_ids.get_or_load(fingerprint, load)
+    except Exception:
+        failed_account_ids.set(fingerprint, True)
+        return fingerprint
+
+
+class ClientPool:
+    """
+    Thread-safe LRU registry of botocore clients keyed by
+    (credential fingerprint, region, service).
+
+    Clients are thread-safe once built, so a single client per key is
+    shared by every request for that account, reusing its parsed service
+    model, endpoint resolver and HTTPS connection pool.
+    """
+
+    def __init__(
+        self, maxsize: int = CLIENT_POOL_SIZE, ttl: float = CLIENT_TTL_SECONDS
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user: dict, service: str = "ec2", region: str = None):
+        fingerprint = credential_fingerprint(user)
+        key = (fingerprint, region or user["region"], service)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._clients.move_to_end(key)
+                return entry[0]
+
+        # Build outside the lock: client construction is the slow part and must
+        # not serialize requests for unrelated accounts.
+        client = self._build(user, service, key[1], fingerprint)
+
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._clients.move_to_end(key)
+                return entry[0]
+            self._clients[key] = (client, now)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.maxsize:
+                self._clients.popitem(last=False)
+        return client
+
+    def _build(self, user: dict, service: str, region: str, fingerprint: str):
+        with span("client_build"):
+            client = new_session().create_client(
+                service,
+                region_name=region,
+                aws_access_key_id=user["access_key"],
+                aws_secret_access_key=user["secret_key"],
+                config=CLIENT_CONFIG,
+            )
+
+        def govern(model, **kwargs):
+            # EC2 meters request rates per account, so every key of one
+            # account draws on the same buckets.
+            governor.acquire(account_id(user), region, model.name)
+
+        def evict_on_invalid_credentials(parsed, **kwargs):
+            # A rotated or deleted key must not stay pooled until its TTL runs out.
+            code = (parsed or {}).get("Error", {}).get("Code")
+            if code in INVALID_CREDENTIAL_CODES:
+                self.evict(fingerprint)
+
+        if service == "ec2":
+            # Registered ahead of instrumentation so calls rejected locally
+            # never count as AWS calls.
+            client.meta.events.register("before-call", govern)
+        client.meta.events.register("after-call", evict_on_invalid_credentials)
+        instrument_client(client)
+        return client
+
+    def evict(self, fingerprint: str):
+        """Drops every client built from the given credentials."""
+        with self._lock:
+            for key in [k for k in self._clients if k[0] == fingerprint]:
+                del self._clients[key]
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+client_pool = ClientPool()
+
+
+def get_client(user: dict, service: str = "ec2", region: str = None):
+    return client_pool.get(user, service=service, region=region)
@@ -0,0 +1,231 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import orjson
+
+from app.services.clients import credential_fingerprint
+from app.services.executor import run_blocking
+from app.services.inventory import TRANSITIONAL_STATES
+from app.services.manager import instance_states
+
+EVENTS_FAST_INTERVAL = float(os.getenv("EVENTS_FAST_INTERVAL_SECONDS", "2"))
+EVENTS_SLOW_INTERVAL = float(os.getenv("EVENTS_SLOW_INTERVAL_SECONDS", "30"))
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "256"))
+EVENTS_HISTORY_SIZE = int(os.getenv("EVENTS_HISTORY_SIZE", "1024"))
+# Pollers outlive their last subscriber briefly, so reconnects can resume.
+EVENTS_LINGER_SECONDS = float(os.getenv("EVENTS_LINGER_SECONDS", "60"))
+
+
+def format_sse(event: dict):
+    lines = [f"event: {event['event']}"]
+    if event.get("id"):
+        lines.append(f"id: {event['id']}")
+    lines.append(f"data: {orjson.dumps(event['data']).decode()}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+class Subscription:
+    """
+    One client's bounded event buffer. A client that falls a full buffer
+    behind is cut off; it reconnects with its last event id and is replayed
+    from the poller's history.
+    """
+
+    def __init__(self, poller):
+        self.poller = poller
+        self.needs_snapshot = True
+        self.overflowed = False
+        self._queue = asyncio.Queue(EVENTS_BUFFER_SIZE)
+
+    def push(self, event: dict):
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+
+    async def next(self, timeout: float):
+        """
+        Returns the next event, or None after `timeout` idle seconds or once
+        the subscription has overflowed.
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.poller.unsubscribe(self)
+
+
+class StatePoller:
+    """
+    Polls one account's instance states in one region on behalf of every
+    subscriber, publishing each transition once.
+
+    The interval drops to EVENTS_FAST_INTERVAL while any instance is in a
+    transitional state and doubles back towards EVENTS_SLOW_INTERVAL on every
+    quiet tick. Event ids are `<epoch>-<seq>`; the epoch changes whenever a
+    poller is recreated, so stale ids are answered with a fresh snapshot.
+    """
+
+    def __init__(self, hub, key: tuple, user: dict):
+        self.hub = hub
+        self.key = key
+        self.user = user
+        self.epoch = str(int(time.time() * 1000))
+        self.seq = 0
+        self.states = None
+        self.history = deque(maxlen=EVENTS_HISTORY_SIZE)
+        self.subscribers = set()
+        self.interval = EVENTS_FAST_INTERVAL
+        self.idle_since = None
+        self._wake = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    @property
+    def last_id(self):
+        return f"{self.epoch}-{self.seq}"
+
+    def subscribe(self, last_event_id: str = None):
+        subscription = Subscription(self)
+        self.subscribers.add(subscription)
+        self.idle_since = None
+
+        epoch, _, seq = (last_event_id or "").partition("-")
+        oldest = self.history[0]["seq"] if self.history else self.seq + 1
+        missed = None
+        if epoch == self.epoch and seq.isdigit() and int(seq) + 1 >= oldest:
+            missed = [event for event in self.history if event["seq"] > int(seq)]
+        # A gap the buffer can't hold would overflow again on every reconnect.
+        if missed is not None and len(missed) < EVENTS_BUFFER_SIZE:
+            subscription.needs_snapshot = False
+            for event in missed:
+                subscription.push(event)
+        elif self.states is not None:
+            self._send_snapshot(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+        if not self.subscribers:
+            self.idle_since = time.monotonic()
+
+    def wake(self):
+        self.interval = EVENTS_FAST_INTERVAL
+        self._wake.set()
+
+    def _send_snapshot(self, subscription: Subscription):
+        subscription.needs_snapshot = False
+        subscription.push(
+            {
+                "event": "snapshot",
+                "id": self.last_id,
+                "data": {"instances": self.states},
+            }
+        )
+
+    def _publish(self, name: str, data: dict):
+        self.seq += 1
+        event = {"event": name, "id": self.last_id, "seq": self.seq, "data": data}
+        self.history.append(event)
+        for subscription in list(self.subscribers):
+            subscription.push(event)
+
+    def _apply(self, states: dict):
+        now = datetime.now(timezone.utc).isoformat()
+        if self.states is not None:
+            # Instances AWS no longer reports are published with state None.
+            for iid in self.states.keys() | states.keys():
+                previous, state = self.states.get(iid), states.get(iid)
+                if previous != state:
+                    self._publish(
+                        "state",
+                        {
+                            "instance_id": iid,
+                            "previous": previous,
+                            "state": state,
+                            "at": now,
+                        },
+                    )
+        self.states = states
+        for subscription in list(self.subscribers):
+            if subscription.needs_snapshot:
+                self._send_snapshot(subscription)
+
+    def _idle(self):
+        return (
+            not self.subscribers
+            and self.idle_since is not None
+            and time.monotonic() - self.idle_since >= EVENTS_LINGER_SECONDS
+        )
+
+    async def _run(self):
+        try:
+            while not self._idle():
+                # Cleared before polling so a wake() during the call isn't lost.
+                self._wake.clear()
+                try:
+                    states = await run_blocking(instance_states, user=self.user)
+                except Exception as e:
+                    for subscription in list(self.subscribers):
+                        subscription.push({"event": "error", "data": {"error": str(e)}})
+                    self.interval = min(EVENTS_SLOW_INTERVAL, self.interval * 2)
+                else:
+                    self._apply(states)
+                    if any(s in TRANSITIONAL_STATES for s in states.values()):
+                        self.interval = EVENTS_FAST_INTERVAL
+                    else:
+                        self.interval = min(EVENTS_SLOW_INTERVAL, self.interval * 2)
+
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # No await between the idle check and this, so no subscriber can
+            # attach to a poller that is shutting down.
+            if self.hub._pollers.get(self.key) is self:
+                del self.hub._pollers[self.key]
+
+
+class InstanceEvents:
+    """Registry of shared pollers keyed by (credential fingerprint, region)."""
+
+    def __init__(self):
+        self._pollers = {}
+
+    def subscribe(self, user: dict, last_event_id: str = None):
+        key = (credential_fingerprint(user), user["region"])
+        poller = self._pollers.get(key)
+        if poller is None:
+            poller = self._pollers[key] = StatePoller(self, key, user)
+        return poller.subscribe(last_event_id)
+
+    def wake(self, user: dict, region: str = None):
+        """Polls right away after a lifecycle call, if anyone is listening."""
+        key = (credential_fingerprint(user), region or user["region"])
+        poller = self._pollers.get(key)
+        if poller is not None:
+            poller.wake()
+
+    async def stop(self):
+        for poller in list(self._pollers.values()):
+            poller.task.cancel()
+            try:
+                await poller.task
+            except asyncio.CancelledError:
+                pass
+
+    def __len__(self):
+        return len(self._pollers)
+
+
+instance_events = InstanceEvents()
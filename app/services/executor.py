@@ -0,0 +1,45 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.profiling import current_profile
+
+
+AWS_EXECUTOR_WORKERS = int(os.getenv("AWS_EXECUTOR_WORKERS", "64"))
+MUTATION_EXECUTOR_WORKERS = int(os.getenv("MUTATION_EXECUTOR_WORKERS", "32"))
+
+# boto3 is blocking. Its calls run here rather than on Starlette's default
+# threadpool, so AWS latency can't starve the event loop or unrelated routes.
+aws_executor = ThreadPoolExecutor(
+    max_workers=AWS_EXECUTOR_WORKERS, thread_name_prefix="nimbly-aws"
+)
+# Lifecycle calls can sit on waiters for minutes; they get their own threads
+# so they never hold the ones reads run on.
+mutation_executor = ThreadPoolExecutor(
+    max_workers=MUTATION_EXECUTOR_WORKERS, thread_name_prefix="nimbly-mutation"
+)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    return await run_on(aws_executor, fn, *args, **kwargs)
+
+
+async def run_on(executor, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    profile = current_profile()
+    if profile is not None:
+        fn = profile.traced(fn)
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(executor, call)
+
+
+async def iterate_blocking(iterator, executor=aws_executor):
+    """Drains a blocking iterator on `executor`, one item at a time."""
+    done = object()
+    while True:
+        item = await run_on(executor, next, iterator, done)
+        if item is done:
+            return
+        yield item
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import re
+
+from fastapi import HTTPException
+
+from app.services.cache import make_cache
+from app.services.clients import credential_fingerprint
+from app.services.executor import run_blocking
+from app.services.governor import RateLimited
+from app.services.manager import list_regions
+
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "16"))
+FANOUT_REGION_TIMEOUT = float(os.getenv("FANOUT_REGION_TIMEOUT_SECONDS", "10"))
+
+REGION_PATTERN = re.compile(r"^[a-z]{2}(-[a-z]+)+-\d+$")
+
+region_cache = make_cache("regions", maxsize=1024, ttl=3600)
+
+
+async def resolve_regions(user: dict, regions: str):
+    """
+    Parses `?regions=a,b,c` or `?regions=all` into a list of region names.
+    Failing to list the account's regions for "all" is a 502.
+    """
+    if regions.strip() == "all":
+        try:
+            return await run_blocking(
+                region_cache.get_or_load,
+                credential_fingerprint(user),
+                lambda: list_regions(user),
+            )
+        except RateLimited:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=502, detail=f"Couldn't list the account's regions: {e}"
+            )
+
+    names = list(dict.fromkeys(r.strip() for r in regions.split(",") if r.strip()))
+    invalid = [r for r in names if not REGION_PATTERN.match(r)]
+    if invalid or not names:
+        raise HTTPException(status_code=422, detail=f"Invalid region(s): {invalid}")
+    return names
+
+
+async def fan_out(fn, user: dict, regions: list[str], **kwargs):
+    """
+    Calls `fn` once per region concurrently, on the AWS executor with at most
+    FANOUT_CONCURRENCY regions in flight and a per-region timeout.
+
+    Returns ({region: result}, {region: error}). Results that are the service
+    layer's `{"error": ..., "message": ...}` dicts count as errors. If every
+    region was turned away by the rate governor, that is raised instead.
+    """
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+
+    async def call(region: str):
+        async with semaphore:
+            return await asyncio.wait_for(
+                run_blocking(fn, user=dict(user, region=region), **kwargs),
+                timeout=FANOUT_REGION_TIMEOUT,
+            )
+
+    outcomes = await asyncio.gather(*(call(r) for r in regions), return_exceptions=True)
+
+    results, errors = {}, {}
+    for region, outcome in zip(regions, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            errors[region] = f"Timed out after {FANOUT_REGION_TIMEOUT}s"
+        elif isinstance(outcome, Exception):
+            errors[region] = str(outcome)
+        elif isinstance(outcome, dict) and "error" in outcome:
+            errors[region] = outcome["error"]
+        else:
+            results[region] = outcome
+
+    limited = [o for o in outcomes if isinstance(o, RateLimited)]
+    if limited and not results:
+        raise max(limited, key=lambda e: e.retry_after)
+    return results, errors
+
+
+def merge_tagged(results: dict, key: str):
+    """Flattens per-region lists found under `key`, tagging each item with its region."""
+    return [
+        dict(item, region=region)
+        for region, result in results.items()
+        for item in result[key]
+    ]
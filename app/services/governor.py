@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+
+from app.services.metrics import GOVERNOR_DELAYED, GOVERNOR_REJECTED, GOVERNOR_TOKENS
+
+# EC2 meters each account per region with token buckets: non-mutating calls
+# (Describe*, Get*, ...) share a bucket that refills quickly, mutating calls
+# a larger one that refills slowly. Defaults mirror EC2's published limits;
+# accounts with raised limits can raise these to match.
+GOVERNOR_LIMITS = {
+    "describe": (
+        float(os.getenv("GOVERNOR_DESCRIBE_BURST", "100")),
+        float(os.getenv("GOVERNOR_DESCRIBE_RATE", "20")),
+    ),
+    "mutate": (
+        float(os.getenv("GOVERNOR_MUTATE_BURST", "200")),
+        float(os.getenv("GOVERNOR_MUTATE_RATE", "5")),
+    ),
+}
+GOVERNOR_MAX_WAIT = float(os.getenv("GOVERNOR_MAX_WAIT_SECONDS", "1"))
+GOVERNOR_MAX_BUCKETS = int(os.getenv("GOVERNOR_MAX_BUCKETS", "4096"))
+
+READ_PREFIXES = ("Describe", "Get", "List", "Search")
+
+
+class RateLimited(Exception):
+    """Raised when an account's local request budget is exhausted."""
+
+    def __init__(self, category: str, retry_after: float):
+        self.category = category
+        self.retry_after = retry_after
+        super().__init__(
+            f"Request budget for {category} calls exhausted, "
+            f"retry after {retry_after:.1f}s"
+        )
+
+
+def category(operation: str):
+    return "describe" if operation.startswith(READ_PREFIXES) else "mutate"
+
+
+class Governor:
+    """
+    Token buckets per (AWS account, region, category).
+
+    A call that finds its bucket empty reserves the next token and sleeps
+    until it is due, as long as that is within `max_wait`; otherwise it is
+    rejected with RateLimited before anything is sent to AWS.
+    """
+
+    def __init__(
+        self,
+        limits: dict = GOVERNOR_LIMITS,
+        max_wait: float = GOVERNOR_MAX_WAIT,
+        maxsize: int = GOVERNOR_MAX_BUCKETS,
+    ):
+        self.limits = limits
+        self.max_wait = max_wait
+        self.maxsize = maxsize
+        # key -> [tokens, last refill]; tokens go negative for reservations.
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, account: str, region: str, operation: str):
+        kind = category(operation)
+        capacity, rate = self.limits[kind]
+        key = (account, region, kind)
+        now = time.monotonic()
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.maxsize:
+                    self._prune(now)
+                bucket = self._buckets[key] = [capacity, now]
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            wait = max(0.0, (1 - tokens) / rate)
+            if wait > self.max_wait:
+                bucket[:] = [tokens, now]
+                GOVERNOR_REJECTED.labels(kind).inc()
+                raise RateLimited(kind, wait)
+            bucket[:] = [tokens - 1, now]
+
+        if wait:
+            GOVERNOR_DELAYED.labels(kind).inc()
+            time.sleep(wait)
+
+    def _prune(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping.
+        for key, (tokens, updated) in list(self._buckets.items()):
+            capacity, rate = self.limits[key[2]]
+            if tokens + (now - updated) * rate >= capacity:
+                del self._buckets[key]
+
+    def observe(self):
+        """Samples every bucket's current level into the tokens gauge."""
+        now = time.monotonic()
+        GOVERNOR_TOKENS.clear()
+        with self._lock:
+            for (account, region, kind), (tokens, updated) in self._buckets.items():
+                capacity, rate = self.limits[kind]
+                GOVERNOR_TOKENS.labels(account[:12], region, kind).set(
+                    min(capacity, tokens + (now - updated) * rate)
+                )
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+governor = Governor()
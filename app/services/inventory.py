@@ -0,0 +1,287 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import SessionLocal
+from app.schemas.auth_request import AWS_User
+from app.schemas.inventory import EC2_Instance, Inventory_Sync
+from app.services.auth import get_aws_creds
+from app.services.executor import run_blocking
+from app.services.manager import iter_instances
+from app.services.periodic import PeriodicTask, sync_failed, sync_lock
+from app.services.serialize import aware, parse_offset
+
+INVENTORY_SYNC_INTERVAL = float(os.getenv("INVENTORY_SYNC_INTERVAL", "60"))
+INVENTORY_FAST_SYNC_INTERVAL = float(os.getenv("INVENTORY_FAST_SYNC_INTERVAL", "10"))
+INVENTORY_SYNC_CONCURRENCY = int(os.getenv("INVENTORY_SYNC_CONCURRENCY", "8"))
+
+TRANSITIONAL_STATES = {"pending", "stopping", "shutting-down"}
+
+MIRRORED_FIELDS = (
+    "state",
+    "instance_type",
+    "image_id",
+    "launch_time",
+    "availability_zone",
+    "vpc_id",
+    "subnet_id",
+    "public_ip",
+    "private_ip",
+    "key_name",
+    "tags",
+)
+
+SORT_COLUMNS = {
+    "launch_time": EC2_Instance.launch_time,
+    "state": EC2_Instance.state,
+    "instance_type": EC2_Instance.instance_type,
+}
+
+
+def _row_values(instance: dict):
+    values = {field: instance.get(field) for field in MIRRORED_FIELDS}
+    if values["launch_time"]:
+        values["launch_time"] = datetime.fromisoformat(values["launch_time"])
+    return values
+
+
+def _stored_values(row: EC2_Instance):
+    values = {field: getattr(row, field) for field in MIRRORED_FIELDS}
+    if values["launch_time"]:
+        values["launch_time"] = aware(values["launch_time"])
+    return values
+
+
+def _as_dict(row: EC2_Instance):
+    instance = {"instance_id": row.instance_id, "region": row.region}
+    instance.update(_stored_values(row))
+    if instance["launch_time"]:
+        instance["launch_time"] = instance["launch_time"].isoformat()
+    return instance
+
+
+async def sync_account(db: AsyncSession, user: dict, region: str = None):
+    """
+    Mirrors one account's instances in one region into the local inventory,
+    touching only rows whose fields changed. Returns how many instances are
+    in a transitional state.
+    """
+    region = region or user["region"]
+    async with sync_lock("inventory", (user["user_id"], region)):
+        return await _sync(db, user, region)
+
+
+async def _sync(db: AsyncSession, user: dict, region: str):
+    fetched = await run_blocking(
+        lambda: list(iter_instances(dict(user, region=region)))
+    )
+    try:
+        return await _store(db, user, region, fetched)
+    except IntegrityError:
+        # Another worker inserted the same new instances first; store again
+        # over its rows.
+        await db.rollback()
+        return await _store(db, user, region, fetched)
+
+
+async def _store(db: AsyncSession, user: dict, region: str, fetched: list[dict]):
+    now = datetime.now(timezone.utc)
+
+    result = await db.execute(
+        select(EC2_Instance).where(
+            EC2_Instance.user_id == user["user_id"], EC2_Instance.region == region
+        )
+    )
+    existing = {row.instance_id: row for row in result.scalars()}
+
+    for instance in fetched:
+        values = _row_values(instance)
+        row = existing.pop(instance["instance_id"], None)
+        if row is None:
+            db.add(
+                EC2_Instance(
+                    instance_id=instance["instance_id"],
+                    user_id=user["user_id"],
+                    region=region,
+                    last_synced_at=now,
+                    **values,
+                )
+            )
+            continue
+        stored = _stored_values(row)
+        changed = {f: v for f, v in values.items() if stored[f] != v}
+        if changed:
+            for field, value in changed.items():
+                setattr(row, field, value)
+            row.last_synced_at = now
+
+    if existing:
+        await db.execute(
+            delete(EC2_Instance).where(
+                EC2_Instance.user_id == user["user_id"],
+                EC2_Instance.region == region,
+                EC2_Instance.instance_id.in_(list(existing)),
+            )
+        )
+
+    transitional = sum(1 for i in fetched if i["state"] in TRANSITIONAL_STATES)
+    await db.merge(
+        Inventory_Sync(
+            user_id=user["user_id"],
+            region=region,
+            last_synced_at=now,
+            transitional=transitional,
+        )
+    )
+    await db.commit()
+    return transitional
+
+
+async def record_results(user_id: int, region: str, result: dict):
+    """
+    Writes lifecycle outcomes through to the inventory, so reads from the
+    local index reflect them without waiting for the next sync.
+    """
+    results = result.get("results", [result]) if isinstance(result, dict) else []
+    states = {
+        r["instance_id"]: r["state"]
+        for r in results
+        if r.get("instance_id") and r.get("state") and "error" not in r
+    }
+    if not states:
+        return
+
+    async with SessionLocal() as db:
+        for iid, state in states.items():
+            await db.execute(
+                update(EC2_Instance)
+                .where(EC2_Instance.instance_id == iid, EC2_Instance.user_id == user_id)
+                .values(state=state)
+            )
+        await db.commit()
+    inventory_syncer.mark_dirty(user_id, region)
+
+
+async def list_local_instances(
+    db: AsyncSession,
+    user: dict,
+    state: list[str] = None,
+    instance_type: list[str] = None,
+    tag: list[str] = None,
+    vpc_id: list[str] = None,
+    sort: str = "-launch_time",
+    limit: int = None,
+    next_token: str = None,
+):
+    """
+    Lists instances from the local inventory. The first read for an account
+    that has never been synced performs a sync inline. Pages are cut in SQL
+    unless tags are filtered on, which happens in Python.
+    """
+    offset = parse_offset(next_token)
+    region = user["region"]
+    key = (user["user_id"], region)
+    sync = await db.get(Inventory_Sync, key)
+    if sync is None:
+        async with sync_lock("inventory", key):
+            # Concurrent first reads wait for one sync instead of each running one.
+            sync = await db.get(Inventory_Sync, key)
+            if sync is None:
+                await _sync(db, user, region)
+                sync = await db.get(Inventory_Sync, key)
+
+    query = select(EC2_Instance).where(
+        EC2_Instance.user_id == user["user_id"], EC2_Instance.region == region
+    )
+    if state:
+        query = query.where(EC2_Instance.state.in_(state))
+    if instance_type:
+        query = query.where(EC2_Instance.instance_type.in_(instance_type))
+    if vpc_id:
+        query = query.where(EC2_Instance.vpc_id.in_(vpc_id))
+
+    column = SORT_COLUMNS[sort.lstrip("-")]
+    order = column.desc() if sort.startswith("-") else column.asc()
+    query = query.order_by(order, EC2_Instance.instance_id)
+
+    if tag:
+        rows = (await db.execute(query)).scalars()
+        rows = [row for row in rows if _matches_tags(row.tags, tag)][offset:]
+    else:
+        query = query.offset(offset)
+        if limit:
+            query = query.limit(limit + 1)
+        rows = (await db.execute(query)).scalars().all()
+    page = [_as_dict(row) for row in (rows[:limit] if limit else rows)]
+    more = bool(limit) and len(rows) > limit
+
+    return {
+        "instances": page,
+        "next_token": str(offset + limit) if more else None,
+        "last_synced_at": aware(sync.last_synced_at).isoformat(),
+    }
+
+
+def _matches_tags(tags: dict, wanted: list[str]):
+    for t in wanted or []:
+        key, sep, value = t.partition("=")
+        if key not in (tags or {}) or (sep and tags[key] != value):
+            return False
+    return True
+
+
+class InventorySyncer(PeriodicTask):
+    """
+    Background task that keeps the inventory fresh for every registered
+    account, polling accounts with instances in transitional states on the
+    fast interval and everyone else on the regular one.
+    """
+
+    def __init__(self):
+        super().__init__("inventory", min(INVENTORY_FAST_SYNC_INTERVAL, 5))
+        self._due = {}
+
+    def mark_dirty(self, user_id: int, region: str):
+        self._due[(user_id, region)] = 0
+
+    async def tick(self):
+        await self.sync_due()
+
+    async def sync_due(self):
+        async with SessionLocal() as db:
+            users = {u.id: u for u in (await db.execute(select(AWS_User))).scalars()}
+
+        # Every account's home region, plus any other region a lifecycle call
+        # touched through this API.
+        targets = {(u.id, u.region) for u in users.values()}
+        targets.update(key for key in self._due if key[0] in users)
+
+        now = time.monotonic()
+        due = [key for key in targets if self._due.get(key, 0) <= now]
+        semaphore = asyncio.Semaphore(INVENTORY_SYNC_CONCURRENCY)
+
+        async def sync_one(user_id: int, region: str):
+            async with semaphore:
+                try:
+                    async with SessionLocal() as db:
+                        creds = get_aws_creds(users[user_id])
+                        transitional = await sync_account(db, creds, region)
+                except Exception:
+                    sync_failed(self.name, f"user {user_id} in {region}")
+                    transitional = 0
+                interval = (
+                    INVENTORY_FAST_SYNC_INTERVAL
+                    if transitional
+                    else INVENTORY_SYNC_INTERVAL
+                )
+                self._due[(user_id, region)] = time.monotonic() + interval
+
+        await asyncio.gather(*(sync_one(*key) for key in due))
+
+
+inventory_syncer = InventorySyncer()
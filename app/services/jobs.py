@@ -0,0 +1,86 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "16"))
+JOB_STORE_SIZE = int(os.getenv("JOB_STORE_SIZE", "1000"))
+
+
+class JobStore:
+    """
+    Runs long lifecycle operations on a dedicated pool so they never hold one
+    of FastAPI's request threads, and keeps the most recent jobs for polling.
+
+    Once the store is full, the oldest finished jobs are dropped first; jobs
+    that are still queued or running are never evicted.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, maxsize: int = JOB_STORE_SIZE):
+        self.maxsize = maxsize
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="nimbly-job"
+        )
+
+    def submit(self, owner, operation: str, fn, *args, **kwargs):
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "owner": owner,
+            "operation": operation,
+            "status": "queued",
+            "result": None,
+            "error": None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None,
+        }
+
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            self._evict()
+
+        accepted = self.view(job)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return accepted
+
+    def _run(self, job: dict, fn, args, kwargs):
+        job["status"] = "running"
+        try:
+            result = fn(*args, **kwargs)
+            # Service functions report AWS failures as {"error": ..., "message": ...}.
+            if isinstance(result, dict) and "error" in result:
+                job["status"] = "failed"
+                job["error"] = result["error"]
+            else:
+                job["status"] = "succeeded"
+            job["result"] = result
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    def _evict(self):
+        if len(self._jobs) <= self.maxsize:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.maxsize:
+                break
+            if self._jobs[job_id]["finished_at"] is not None:
+                del self._jobs[job_id]
+
+    def get(self, job_id: str, owner):
+        job = self._jobs.get(job_id)
+        if job is None or job["owner"] != owner:
+            return None
+        return self.view(job)
+
+    @staticmethod
+    def view(job: dict):
+        return {k: v for k, v in job.items() if k != "owner"}
+
+
+job_store = JobStore()
@@ -1,98 +1,421 @@
+import base64
+import binascii
+import json
+import os
+import re
+import time
+from concurrent.futures import as_completed
+from datetime import datetime, timezone
 from io import BytesIO
-import boto3
 
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
 
 from app.models.ec2 import InstanceLaunchRequest, SecurityGroupRequest
+from app.services.cache import make_cache
+from app.services.clients import credential_fingerprint, get_client
+from app.services.governor import RateLimited
+from app.services.metrics import WAITER_DURATION
+from app.services.profiling import span
+from app.services.rules import rule_indexes
+from app.services.singleflight import coalesced
+from app.services.waiters import StateError, waiter_service
 
+# EC2 rejects lifecycle calls that name too many instances at once.
+BATCH_CHUNK_SIZE = int(os.getenv("EC2_BATCH_CHUNK_SIZE", "1000"))
 
-def get_ec2_client(user: dict):
-    ec2 = boto3.client(
-        "ec2",
-        region_name=user["region"],
-        aws_access_key_id=user["access_key"],
-        aws_secret_access_key=user["secret_key"],
-    )
-    return ec2
+LAUNCH_TIMEOUT = float(os.getenv("LAUNCH_TIMEOUT_SECONDS", "600"))
 
+# Public AMI owners mirrored into the local image catalog.
+AMI_CATALOG_OWNERS = os.getenv("AMI_CATALOG_OWNERS", "amazon").split(",")
 
-def identify(user: dict):
-    session = boto3.Session(
-        region_name=user["region"],
-        aws_access_key_id=user["access_key"],
-        aws_secret_access_key=user["secret_key"],
-    )
+vpc_cache = make_cache(
+    "vpcs", maxsize=1024, ttl=float(os.getenv("VPC_CACHE_TTL_SECONDS", "3600"))
+)
+
+# Short-lived copies of list results, so clients polling with If-None-Match
+# are answered without an AWS call. Mutations made through the API drop the
+# affected entry right away.
+list_cache = make_cache(
+    "lists", maxsize=4096, ttl=float(os.getenv("LIST_CACHE_TTL_SECONDS", "10"))
+)
+
+BATCH_ACTIONS = {
+    "start": ("start_instances", "running"),
+    "stop": ("stop_instances", "stopped"),
+    "terminate": ("terminate_instances", "terminated"),
+}
+
+
+def error_response(e: Exception, message: str):
+    """Shapes a failure as `{"error", "message"}`, letting local throttling through."""
+    if isinstance(e, RateLimited):
+        raise e
+    return {"error": str(e), "message": message}
+
+
+def list_key(kind: str, user: dict, region: str = None):
+    return (kind, credential_fingerprint(user), region or user["region"])
+
+
+def get_ec2_client(user: dict, region: str = None):
+    return get_client(user, service="ec2", region=region)
+
+
+def wait_for_state(user: dict, iids: list[str], target: str, region: str = None):
+    """
+    Blocks until every instance reaches `target`, through the shared waiter
+    service. Raises the first instance's failure, if any.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        futures = waiter_service.wait(user, iids, target, region=region)
+        with span("wait"):
+            for future in futures.values():
+                future.result()
+        outcome = "ok"
+    finally:
+        WAITER_DURATION.labels(f"instance_{target}", outcome).observe(
+            time.perf_counter() - started
+        )
 
+
+@coalesced("get_caller_identity")
+def identify(user: dict):
     try:
-        sts = session.client("sts")
+        sts = get_client(user, service="sts")
         identity = sts.get_caller_identity()
         return identity["Arn"]
+    except RateLimited:
+        raise
     except Exception as e:
         return f"Invalid credentials or failed session: {str(e)}"
 
 
-def describe_instances(user: dict):
+def instance_filters(
+    state: list[str] = None,
+    instance_type: list[str] = None,
+    tag: list[str] = None,
+    vpc_id: list[str] = None,
+):
+    """
+    Builds EC2 `Filters` from listing query parameters. Tags are given as
+    `Key=Value`, or just `Key` to match any value.
+    """
+    filters = []
+    if state:
+        filters.append({"Name": "instance-state-name", "Values": state})
+    if instance_type:
+        filters.append({"Name": "instance-type", "Values": instance_type})
+    if vpc_id:
+        filters.append({"Name": "vpc-id", "Values": vpc_id})
+    for t in tag or []:
+        key, sep, value = t.partition("=")
+        if sep:
+            filters.append({"Name": f"tag:{key}", "Values": [value]})
+        else:
+            filters.append({"Name": "tag-key", "Values": [key]})
+    return filters
+
+
+def _tags(resource: dict):
+    return {t["Key"]: t["Value"] for t in resource.get("Tags", [])}
+
+
+def flatten_instance(instance: dict):
+    """Reduces a boto3 instance description to the fields clients actually use."""
+    launch_time = instance.get("LaunchTime")
+    return {
+        "instance_id": instance["InstanceId"],
+        "state": instance["State"]["Name"],
+        "instance_type": instance.get("InstanceType"),
+        "image_id": instance.get("ImageId"),
+        "launch_time": launch_time.isoformat() if launch_time else None,
+        "availability_zone": instance.get("Placement", {}).get("AvailabilityZone"),
+        "vpc_id": instance.get("VpcId"),
+        "subnet_id": instance.get("SubnetId"),
+        "public_ip": instance.get("PublicIpAddress"),
+        "private_ip": instance.get("PrivateIpAddress"),
+        "key_name": instance.get("KeyName"),
+        "tags": _tags(instance),
+    }
+
+
+def flatten_image(image: dict):
+    return {
+        "image_id": image["ImageId"],
+        "name": image.get("Name"),
+        "description": image.get("Description"),
+        "architecture": image.get("Architecture"),
+        "owner_id": image.get("OwnerId"),
+        "owner_alias": image.get("ImageOwnerAlias"),
+        "creation_date": image.get("CreationDate"),
+        "virtualization_type": image.get("VirtualizationType"),
+        "root_device_type": image.get("RootDeviceType"),
+        "platform_details": image.get("PlatformDetails"),
+        "state": image.get("State"),
+    }
+
+
+def flatten_key_pair(key_pair: dict):
+    create_time = key_pair.get("CreateTime")
+    return {
+        "key_name": key_pair["KeyName"],
+        "key_pair_id": key_pair.get("KeyPairId"),
+        "key_type": key_pair.get("KeyType"),
+        "key_fingerprint": key_pair.get("KeyFingerprint"),
+        "create_time": create_time.isoformat() if create_time else None,
+        "tags": _tags(key_pair),
+    }
+
+
+def _flatten_permission(permission: dict):
+    return {
+        "protocol": permission["IpProtocol"],
+        "from_port": permission.get("FromPort"),
+        "to_port": permission.get("ToPort"),
+        "cidrs": [r["CidrIp"] for r in permission.get("IpRanges", [])]
+        + [r["CidrIpv6"] for r in permission.get("Ipv6Ranges", [])],
+        "group_ids": [p["GroupId"] for p in permission.get("UserIdGroupPairs", [])],
+    }
+
+
+def flatten_security_group(group: dict):
+    return {
+        "group_id": group["GroupId"],
+        "group_name": group["GroupName"],
+        "description": group.get("Description"),
+        "vpc_id": group.get("VpcId"),
+        "ingress": [_flatten_permission(p) for p in group.get("IpPermissions", [])],
+        "egress": [
+            _flatten_permission(p) for p in group.get("IpPermissionsEgress", [])
+        ],
+        "tags": _tags(group),
+    }
+
+
+def _encode_page_token(token: str | None, skip: int, page_size: int):
+    raw = json.dumps([token, skip, page_size]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_page_token(next_token: str):
+    """
+    Unpacks a `next_token` into the AWS token of the page it points into,
+    how many of that page's instances were already returned, and the page
+    size the AWS token was issued for.
+    """
+    try:
+        token, skip, page_size = json.loads(base64.urlsafe_b64decode(next_token))
+        if (
+            (token is None or isinstance(token, str))
+            and all(type(n) is int for n in (skip, page_size))
+            and 0 <= skip
+            and 5 <= page_size <= 1000
+        ):
+            return token, skip, page_size
+    except (binascii.Error, ValueError, TypeError):
+        pass
+    raise HTTPException(status_code=422, detail="Invalid next_token")
+
+
+@coalesced("describe_instances")
+def describe_instances(
+    user: dict, filters: list = None, limit: int = None, next_token: str = None
+):
     """
     Returns information about your EC2 instances in the given region.
+
+    Every page is fetched unless `limit` is given, in which case at most
+    `limit` instances are returned along with a `next_token` to resume from.
+    AWS pages by reservation, and one reservation can hold a whole launch,
+    so the token also records where in its page the last one stopped.
     """
     ec2 = get_ec2_client(user)
-    response = ec2.describe_instances()
-    return response
+    if next_token:
+        token, skip, page_size = _decode_page_token(next_token)
+    else:
+        token, skip, page_size = None, 0, min(max(limit or 1000, 5), 1000)
+
+    instances = []
+    while True:
+        params = {"Filters": filters or [], "MaxResults": page_size}
+        if token:
+            params["NextToken"] = token
+        try:
+            page = ec2.describe_instances(**params)
+        except ClientError as e:
+            if token and e.response["Error"]["Code"] == "InvalidParameterValue":
+                raise HTTPException(status_code=422, detail="Invalid next_token")
+            raise
+        found = [
+            flatten_instance(instance)
+            for reservation in page["Reservations"]
+            for instance in reservation["Instances"]
+        ][skip:]
+
+        if limit and len(instances) + len(found) > limit:
+            taken = limit - len(instances)
+            instances.extend(found[:taken])
+            resume = _encode_page_token(token, skip + taken, page_size)
+            return {"instances": instances, "next_token": resume}
+
+        instances.extend(found)
+        token, skip = page.get("NextToken"), 0
+        if not token:
+            return {"instances": instances, "next_token": None}
+        if limit and len(instances) == limit:
+            resume = _encode_page_token(token, 0, page_size)
+            return {"instances": instances, "next_token": resume}
+
+
+def iter_instances(user: dict, filters: list = None):
+    """Yields flattened instances page by page as AWS returns them."""
+    ec2 = get_ec2_client(user)
+    paginator = ec2.get_paginator("describe_instances")
+
+    for page in paginator.paginate(Filters=filters or []):
+        for reservation in page["Reservations"]:
+            for instance in reservation["Instances"]:
+                yield flatten_instance(instance)
+
 
+@coalesced("list_instances")
+def list_instances(user: dict, filters: list = None):
+    """Returns every flattened instance in the user's region."""
+    return {"instances": list(iter_instances(user, filters=filters))}
 
-def describe_images(user: dict):
+
+@coalesced("describe_instance_status")
+def instance_states(user: dict):
     """
-    Returns the catalog of AMIs available to your account.
+    Maps every instance in the user's region to its state. describe_instance_status
+    returns a few fields per instance, so it is much lighter than describe_instances.
     """
     ec2 = get_ec2_client(user)
+    paginator = ec2.get_paginator("describe_instance_status")
 
-    response = ec2.describe_images(
-        Owners=["amazon"],
-        Filters=[
-            {"Name": "architecture", "Values": ["x86_64"]},
-            {"Name": "root-device-type", "Values": ["ebs"]},
-            {"Name": "virtualization-type", "Values": ["hvm"]},
-            {"Name": "name", "Values": ["amzn2-ami-hvm-*-x86_64-gp2"]},
-            {"Name": "state", "Values": ["available"]},
-        ],
-    )
-    return response
+    states = {}
+    for page in paginator.paginate(IncludeAllInstances=True):
+        for status in page["InstanceStatuses"]:
+            states[status["InstanceId"]] = status["InstanceState"]["Name"]
+    return states
 
 
-def launch_ec2_instance(data: InstanceLaunchRequest, user: dict):
-    """Launches an EC2 instance with the provided data."""
-    try:
-        ec2 = boto3.resource(
-            "ec2",
-            region_name=data.region,
-            aws_access_key_id=user["access_key"],
-            aws_secret_access_key=user["secret_key"],
-        )
+def creation_months(since: datetime):
+    """`creation-date` filter values covering every month from `since` to now."""
+    year, month = since.year, since.month
+    now = datetime.now(timezone.utc)
+    months = []
+    while (year, month) <= (now.year, now.month):
+        months.append(f"{year:04d}-{month:02d}-*")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
 
-        instances = ec2.create_instances(
-            ImageId=data.ami_id,
-            MinCount=1,
-            MaxCount=1,
-            InstanceType=data.instance_type,
-            KeyName=data.key_name,
-            SecurityGroupIds=[data.security_group_id],
-        )
 
-        instance = instances[0]
-        instance.wait_until_running()
-        instance.load()
+def iter_catalog_images(user: dict, region: str, since: datetime = None):
+    """
+    Yields the available AMIs of the catalog owners in `region`. With `since`,
+    only those created in or after its month, as `creation-date` filters take
+    wildcards rather than ranges.
+    """
+    filters = [{"Name": "state", "Values": ["available"]}]
+    if since:
+        filters.append({"Name": "creation-date", "Values": creation_months(since)})
+    paginator = get_ec2_client(user, region=region).get_paginator("describe_images")
+    pages = paginator.paginate(
+        Owners=AMI_CATALOG_OWNERS,
+        Filters=filters,
+        PaginationConfig={"PageSize": 1000},
+    )
+    for page in pages:
+        for image in page["Images"]:
+            yield flatten_image(image)
+
+
+def run_instances(data: InstanceLaunchRequest, user: dict):
+    """Requests all `data.count` instances in one call and returns their IDs."""
+    ec2 = get_ec2_client(user, region=data.region)
+
+    params = dict(
+        ImageId=data.ami_id,
+        MinCount=data.min_count or data.count,
+        MaxCount=data.count,
+        InstanceType=data.instance_type,
+        KeyName=data.key_name,
+        SecurityGroupIds=[data.security_group_id],
+    )
+    if data.subnet_id:
+        params["SubnetId"] = data.subnet_id
+    if data.tags:
+        tags = [{"Key": k, "Value": v} for k, v in data.tags.items()]
+        params["TagSpecifications"] = [{"ResourceType": "instance", "Tags": tags}]
 
-        return {
-            "instance_id": instance.id,
-            "state": instance.state["Name"],
-            "public_ip": instance.public_ip_address,
+    response = ec2.run_instances(**params)
+    return [instance["InstanceId"] for instance in response["Instances"]]
+
+
+def track_running(iids: list[str], user: dict, region: str = None):
+    """
+    Follows newly launched instances through the shared waiter service,
+    yielding each instance's result as soon as it is running, or as a failure
+    once it can no longer get there or LAUNCH_TIMEOUT passes.
+    """
+    started = time.perf_counter()
+    futures = waiter_service.wait(
+        user, iids, "running", region=region, timeout=LAUNCH_TIMEOUT
+    )
+    owners = {future: iid for iid, future in futures.items()}
+    outcome = "ok"
+
+    for future in as_completed(owners):
+        iid = owners[future]
+        try:
+            instance = future.result()
+        except StateError as e:
+            outcome = "error"
+            yield {"instance_id": iid, "state": e.state, "error": str(e)}
+            continue
+        except Exception as e:
+            outcome = "error"
+            yield {"instance_id": iid, "state": "pending", "error": str(e)}
+            continue
+        yield {
+            "instance_id": iid,
+            "state": "running",
+            "public_ip": instance.get("PublicIpAddress"),
+            "private_ip": instance.get("PrivateIpAddress"),
         }
 
+    WAITER_DURATION.labels("launch", outcome).observe(time.perf_counter() - started)
+
+
+def launch_ec2_instance(data: InstanceLaunchRequest, user: dict):
+    """
+    Launches `data.count` EC2 instances and waits until they are running. A
+    single launch returns that instance's result; larger ones report every
+    instance the way batch actions do.
+    """
+    try:
+        iids = run_instances(data, user)
+        results = list(track_running(iids, user, region=data.region))
     except Exception as e:
-        return {
-            "error": str(e),
-            "message": "Failed to launch instance. Check credentials, parameters, and limits.",
-        }
+        return error_response(
+            e, "Failed to launch instance. Check credentials, parameters, and limits."
+        )
+
+    if data.count == 1:
+        return results[0]
+
+    failed = sum(1 for r in results if "error" in r)
+    return {
+        "action": "launch",
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": results,
+    }
 
 
 def start_ec2_instance(iid: str, user: dict):
@@ -100,13 +423,12 @@ def start_ec2_instance(iid: str, user: dict):
         ec2 = get_ec2_client(user)
 
         ec2.start_instances(InstanceIds=[iid])
-        waiter = ec2.get_waiter("instance_running")
-        waiter.wait(InstanceIds=[iid])
+        wait_for_state(user, [iid], "running")
 
         return {"instance_id": iid, "state": "running"}
 
     except Exception as e:
-        return {"error": str(e), "message": f"Couldn't start instance: {iid}"}
+        return error_response(e, f"Couldn't start instance: {iid}")
 
 
 def stop_ec2_instance(iid: str, user: dict):
@@ -114,13 +436,12 @@ def stop_ec2_instance(iid: str, user: dict):
         ec2 = get_ec2_client(user)
 
         ec2.stop_instances(InstanceIds=[iid])
-        waiter = ec2.get_waiter("instance_stopped")
-        waiter.wait(InstanceIds=[iid])
+        wait_for_state(user, [iid], "stopped")
 
         return {"instance_id": iid, "state": "stopped"}
 
     except Exception as e:
-        return {"error": str(e), "message": f"Couldn't stop instance: {iid}"}
+        return error_response(e, f"Couldn't stop instance: {iid}")
 
 
 def terminate_ec2_instance(iid: str, user: dict):
@@ -128,18 +449,85 @@ def terminate_ec2_instance(iid: str, user: dict):
         ec2 = get_ec2_client(user)
 
         ec2.terminate_instances(InstanceIds=[iid])
-        waiter = ec2.get_waiter("instance_terminated")
-        waiter.wait(InstanceIds=[iid])
+        wait_for_state(user, [iid], "terminated")
 
         return {"instance_id": iid, "state": "terminated"}
 
     except Exception as e:
-        return {"error": str(e), "message": f"Couldn't terminate instance: {iid}"}
+        return error_response(e, f"Couldn't terminate instance: {iid}")
+
 
+def batch_instance_action(action: str, iids: list[str], user: dict):
+    """
+    Starts, stops or terminates many instances with one API call per chunk,
+    waiting on all of them through the shared waiter service, and reports the
+    outcome for every instance.
+    """
+    operation, target = BATCH_ACTIONS[action]
+    ids = list(dict.fromkeys(iids))
+    results = {iid: {"instance_id": iid, "state": None} for iid in ids}
 
-def create_key_pair_as_file(key_name: str, user: dict):
     try:
         ec2 = get_ec2_client(user)
+    except Exception as e:
+        return error_response(e, f"Couldn't {action} instances.")
+
+    submitted = []
+    for i in range(0, len(ids), BATCH_CHUNK_SIZE):
+        chunk = ids[i : i + BATCH_CHUNK_SIZE]
+        try:
+            getattr(ec2, operation)(InstanceIds=chunk)
+            submitted.extend(chunk)
+        except Exception as e:
+            # Once earlier chunks are under way, the caller needs the report
+            # more than a 429.
+            if isinstance(e, RateLimited) and not submitted:
+                raise
+            # EC2 rejects the whole call when some IDs are unknown and names them
+            # in the message; fail just those and resubmit the rest once.
+            bad = set()
+            if isinstance(e, ClientError):
+                bad = set(re.findall(r"i-[0-9a-f]+", str(e))) & set(chunk)
+            rest = [iid for iid in chunk if iid not in bad]
+            if bad and rest:
+                try:
+                    getattr(ec2, operation)(InstanceIds=rest)
+                    submitted.extend(rest)
+                except Exception as retry_error:
+                    for iid in rest:
+                        results[iid]["error"] = str(retry_error)
+                chunk = list(bad)
+            for iid in chunk:
+                results[iid]["error"] = str(e)
+
+    started = time.perf_counter()
+    futures = waiter_service.wait(user, submitted, target)
+    for iid, future in futures.items():
+        result = results[iid]
+        try:
+            result["state"] = future.result()["State"]["Name"]
+        except StateError as e:
+            result["state"] = e.state
+            result["error"] = str(e)
+        except Exception as e:
+            result["error"] = str(e)
+    WAITER_DURATION.labels(
+        f"instance_{target}",
+        "error" if any("error" in r for r in results.values()) else "ok",
+    ).observe(time.perf_counter() - started)
+
+    failed = sum(1 for r in results.values() if "error" in r)
+    return {
+        "action": action,
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": list(results.values()),
+    }
+
+
+def create_key_pair_as_file(key_name: str, user: dict, region: str = None):
+    try:
+        ec2 = get_ec2_client(user, region=region)
 
         key_pair = ec2.create_key_pair(KeyName=key_name)
 
@@ -157,68 +545,166 @@ def create_key_pair_as_file(key_name: str, user: dict):
             headers={"Content-Disposition": f"attachment; filename={filename}"},
         )
     except Exception as e:
-        return {"error": str(e), "message": "Couldn't create key pair."}
+        return error_response(e, "Couldn't create key pair.")
+    finally:
+        list_cache.delete(list_key("key_pairs", user, region))
+
+
+def default_vpc_id(user: dict, region: str = None):
+    """Returns the account's default VPC in the region, cached per account and region."""
+    region = region or user["region"]
+
+    def load():
+        ec2 = get_ec2_client(user, region=region)
+        vpcs = ec2.describe_vpcs(Filters=[{"Name": "is-default", "Values": ["true"]}])
+        if not vpcs["Vpcs"]:
+            vpcs = ec2.describe_vpcs()
+        return vpcs["Vpcs"][0]["VpcId"]
+
+    return vpc_cache.get_or_load((credential_fingerprint(user), region), load)
+
+
+def ip_permissions(rules: list[tuple]):
+    """
+    Groups (protocol, port, cidr) rules into one `IpPermissions` entry per
+    protocol and port, so any number of rules can be sent in a single call.
+    """
+    grouped = {}
+    for protocol, port, cidr in rules:
+        grouped.setdefault((protocol, port), []).append({"CidrIp": cidr})
+    return [
+        {"IpProtocol": protocol, "FromPort": port, "ToPort": port, "IpRanges": cidrs}
+        for (protocol, port), cidrs in grouped.items()
+    ]
 
 
 def create_security_group(data: SecurityGroupRequest, user: dict):
     try:
-        ec2 = get_ec2_client(user)
+        ec2 = get_ec2_client(user, region=data.region)
 
         if not data.vpc_id:
-            vpcs = ec2.describe_vpcs()
-            data.vpc_id = vpcs["Vpcs"][0]["VpcId"]
+            data.vpc_id = default_vpc_id(user, region=data.region)
 
         response = ec2.create_security_group(
             GroupName=data.group_name, Description=data.description, VpcId=data.vpc_id
         )
 
-        for rule in data.rules:
+        rules = {(rule.protocol, rule.port, rule.cidr) for rule in data.rules}
+        if rules:
             ec2.authorize_security_group_ingress(
-                GroupId=response["GroupId"],
-                IpProtocol=rule.protocol,
-                FromPort=rule.port,
-                ToPort=rule.port,
-                CidrIp=rule.cidr,
+                GroupId=response["GroupId"], IpPermissions=ip_permissions(rules)
             )
 
+        rule_indexes.group_changed(user, response["GroupId"], region=data.region)
         return {
             "group_id": response["GroupId"],
             "message": "Security group created successfully",
         }
 
     except Exception as e:
-        return {"error": str(e), "message": "Could not create security group"}
+        return error_response(e, "Could not create security group")
+    finally:
+        list_cache.delete(list_key("security_groups", user, data.region))
 
 
-def get_all_keypairs(user: dict):
+def sync_security_group_rules(gid: str, rules: list, user: dict):
+    """
+    Makes the group's IPv4 CIDR ingress rules match `rules` with at most one
+    authorize and one revoke call. Rules that reference other groups, prefix
+    lists or IPv6 ranges are left untouched.
+    """
     try:
         ec2 = get_ec2_client(user)
 
-        key_pairs = ec2.describe_key_pairs()
+        existing = {}
+        paginator = ec2.get_paginator("describe_security_group_rules")
+        pages = paginator.paginate(Filters=[{"Name": "group-id", "Values": [gid]}])
+        for page in pages:
+            for rule in page["SecurityGroupRules"]:
+                if rule["IsEgress"] or "CidrIpv4" not in rule:
+                    continue
+                ports = (rule["FromPort"],)
+                if rule["FromPort"] != rule["ToPort"]:
+                    ports = (rule["FromPort"], rule["ToPort"])
+                key = (rule["IpProtocol"], *ports, rule["CidrIpv4"])
+                existing.setdefault(key, []).append(rule["SecurityGroupRuleId"])
+
+        desired = {(rule.protocol, rule.port, rule.cidr) for rule in rules}
+        to_authorize = desired - existing.keys()
+        to_revoke = [
+            rule_id
+            for key, rule_ids in existing.items()
+            if key not in desired
+            for rule_id in rule_ids
+        ]
+
+        # Authorize before revoking so no desired access is ever briefly missing.
+        if to_authorize:
+            ec2.authorize_security_group_ingress(
+                GroupId=gid, IpPermissions=ip_permissions(to_authorize)
+            )
+        if to_revoke:
+            ec2.revoke_security_group_ingress(
+                GroupId=gid, SecurityGroupRuleIds=to_revoke
+            )
+
+        return {
+            "group_id": gid,
+            "authorized": len(to_authorize),
+            "revoked": len(to_revoke),
+            "unchanged": len(desired) - len(to_authorize),
+        }
 
-        return key_pairs
     except Exception as e:
-        return {"error": str(e), "message": "Couldn't create key pair."}
+        return error_response(e, f"Couldn't sync rules for {gid}.")
+    finally:
+        list_cache.delete(list_key("security_groups", user))
+        # Even a partial failure may have changed the group.
+        rule_indexes.group_changed(user, gid)
+
 
+@coalesced("describe_key_pairs")
+def get_all_keypairs(user: dict):
+    def load():
+        response = get_ec2_client(user).describe_key_pairs()
+        return {"key_pairs": [flatten_key_pair(k) for k in response["KeyPairs"]]}
 
-def delete_keypair(key_name: str, user: dict):
     try:
-        ec2 = get_ec2_client(user)
+        return list_cache.get_or_load(list_key("key_pairs", user), load)
+    except Exception as e:
+        return error_response(e, "Couldn't create key pair.")
+
+
+def delete_keypair(key_name: str, user: dict, region: str = None):
+    try:
+        ec2 = get_ec2_client(user, region=region)
         response = ec2.delete_key_pair(KeyName=key_name)
         return response
     except Exception as e:
-        return {"error": str(e), "message": "Couldn't delete key pair."}
+        return error_response(e, "Couldn't delete key pair.")
+    finally:
+        list_cache.delete(list_key("key_pairs", user, region))
 
 
+@coalesced("describe_security_groups")
 def get_security_groups(user: dict):
+    def load():
+        paginator = get_ec2_client(user).get_paginator("describe_security_groups")
+        return {
+            "security_groups": [
+                flatten_security_group(group)
+                for page in paginator.paginate()
+                for group in page["SecurityGroups"]
+            ]
+        }
+
     try:
-        ec2 = get_ec2_client(user)
-        response = ec2.describe_security_groups()
-        return response
+        return list_cache.get_or_load(list_key("security_groups", user), load)
     except Exception as e:
-        return {"error": str(e), "message": "Couldn't fetch security group(s)."}
+        return error_response(e, "Couldn't fetch security group(s).")
 
 
+@coalesced("describe_security_group_rules")
 def get_security_group_rules(gid: str, user: dict):
     try:
         ec2 = get_ec2_client(user)
@@ -227,13 +713,49 @@ def get_security_group_rules(gid: str, user: dict):
         )
         return response
     except Exception as e:
-        return {"error": str(e), "message": "Couldn't fetch security group rule(s)."}
+        return error_response(e, "Couldn't fetch security group rule(s).")
+
+
+def security_group_exposure(
+    user: dict,
+    direction: str = "ingress",
+    protocol: str = "tcp",
+    port: int = None,
+    cidr: str = None,
+    overlaps: bool = False,
+    region: str = None,
+):
+    """Groups with rules letting `protocol`/`port` through for `cidr`, from the rule index."""
+    try:
+        index = rule_indexes.get(user, region)
+        rules = index.query(direction, protocol, port, cidr, overlaps)
+    except Exception as e:
+        return error_response(e, "Couldn't search security group rules.")
+
+    groups = {}
+    for rule in rules:
+        groups.setdefault(rule["group_id"], []).append(rule)
+    return {
+        "groups": [{"group_id": gid, "rules": r} for gid, r in sorted(groups.items())],
+        "rules_indexed": len(index),
+        "indexed_at": datetime.fromtimestamp(index.built_at, timezone.utc),
+    }
+
+
+def list_regions(user: dict):
+    """Returns the regions enabled for the account."""
+    ec2 = get_ec2_client(user)
+    response = ec2.describe_regions()
+    return sorted(r["RegionName"] for r in response["Regions"])
 
 
 def delete_security_group(gid: str, user: dict):
     try:
         ec2 = get_ec2_client(user)
         response = ec2.delete_security_group(GroupId=gid)
+        rule_indexes.group_deleted(user, gid)
         return response
     except Exception as e:
-        return {"error": str(e), "message": "Couldn't delete security group(s)."}
+        return error_response(e, "Couldn't delete security group(s).")
+    finally:
+        list_cache.delete(list_key("security_groups", user))
@@ -0,0 +1,197 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+
+from app.services.profiling import record
+
+THROTTLE_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+}
+
+REQUEST_LATENCY = Histogram(
+    "nimbly_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ["method", "route", "status"],
+)
+AWS_CALLS = Counter(
+    "nimbly_aws_calls_total",
+    "AWS API calls by operation and outcome.",
+    ["service", "operation", "outcome"],
+)
+AWS_LATENCY = Histogram(
+    "nimbly_aws_call_duration_seconds",
+    "AWS API call latency, including botocore retries.",
+    ["service", "operation"],
+)
+AWS_THROTTLES = Counter(
+    "nimbly_aws_throttles_total",
+    "AWS API calls rejected for exceeding the account's request rate.",
+    ["service", "operation"],
+)
+AWS_ERRORS = Counter(
+    "nimbly_aws_errors_total",
+    "AWS API calls that failed, by error code.",
+    ["service", "operation", "code"],
+)
+DB_QUERY_LATENCY = Histogram(
+    "nimbly_db_query_duration_seconds",
+    "Database statement latency by statement type.",
+    ["statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+WAITER_DURATION = Histogram(
+    "nimbly_waiter_duration_seconds",
+    "Time spent waiting for instances to reach a target state.",
+    ["waiter", "outcome"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200),
+)
+WAITER_ACCOUNTS = Gauge(
+    "nimbly_waiter_accounts", "Account/region pairs with instances being waited on."
+)
+WAITER_PENDING = Gauge(
+    "nimbly_waiter_pending", "Open waits for instances to reach a target state."
+)
+COALESCED = Counter(
+    "nimbly_coalesced_requests_total",
+    "Reads answered by another caller's identical in-flight or lingering call.",
+    ["operation", "kind"],
+)
+GOVERNOR_DELAYED = Counter(
+    "nimbly_governor_delayed_total",
+    "AWS calls held back until their account's token bucket refilled.",
+    ["category"],
+)
+GOVERNOR_REJECTED = Counter(
+    "nimbly_governor_rejected_total",
+    "AWS calls rejected locally because the account's budget was exhausted.",
+    ["category"],
+)
+GOVERNOR_TOKENS = Gauge(
+    "nimbly_governor_tokens",
+    "Tokens left per AWS account, region and category.",
+    ["account", "region", "category"],
+)
+ADMISSION_RUNNING = Gauge(
+    "nimbly_admission_running", "Requests holding an admission slot.", ["pool"]
+)
+ADMISSION_QUEUED = Gauge(
+    "nimbly_admission_queued", "Requests waiting for an admission slot.", ["pool"]
+)
+ADMISSION_WAIT = Histogram(
+    "nimbly_admission_wait_seconds",
+    "Time queued requests waited for an admission slot.",
+    ["pool"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+ADMISSION_REJECTED = Counter(
+    "nimbly_admission_rejected_total",
+    "Requests turned away by admission control, by reason.",
+    ["pool", "reason"],
+)
+SYNC_FAILURES = Counter(
+    "nimbly_sync_failures_total",
+    "Background syncs that raised, per sync; the next tick retries them.",
+    ["sync"],
+)
+POOL_WORKERS = Gauge(
+    "nimbly_pool_workers", "Configured worker threads per pool.", ["pool"]
+)
+POOL_BUSY = Gauge("nimbly_pool_busy", "Worker threads currently in use.", ["pool"])
+POOL_QUEUED = Gauge(
+    "nimbly_pool_queued", "Tasks waiting for a free worker thread.", ["pool"]
+)
+
+
+def observe_pool(pool: str, executor):
+    """Samples a ThreadPoolExecutor's saturation into the pool gauges."""
+    queued = executor._work_queue.qsize()
+    idle = executor._idle_semaphore._value
+    POOL_WORKERS.labels(pool).set(executor._max_workers)
+    POOL_BUSY.labels(pool).set(len(executor._threads) - idle)
+    POOL_QUEUED.labels(pool).set(queued)
+
+
+def instrument_client(client):
+    """Records call counts, latency, throttles and errors through botocore events."""
+    service = client.meta.service_model.service_name
+
+    def before_call(model, context, **kwargs):
+        context["nimbly_started"] = time.perf_counter()
+
+    def after_call(model, parsed, context, **kwargs):
+        started = context.pop("nimbly_started", None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            AWS_LATENCY.labels(service, model.name).observe(elapsed)
+            record("aws_call", elapsed)
+        code = (parsed or {}).get("Error", {}).get("Code")
+        if code is None:
+            AWS_CALLS.labels(service, model.name, "ok").inc()
+            return
+        AWS_CALLS.labels(service, model.name, "error").inc()
+        AWS_ERRORS.labels(service, model.name, code).inc()
+        if code in THROTTLE_CODES:
+            AWS_THROTTLES.labels(service, model.name).inc()
+
+    def after_call_error(exception, context, event_name, **kwargs):
+        # Unlike after-call, this event carries no operation model; the
+        # operation is the last part of "after-call-error.<service>.<op>".
+        operation = event_name.rsplit(".", 1)[-1]
+        started = context.pop("nimbly_started", None)
+        if started is not None:
+            record("aws_call", time.perf_counter() - started)
+        AWS_CALLS.labels(service, operation, "error").inc()
+        AWS_ERRORS.labels(service, operation, type(exception).__name__).inc()
+
+    client.meta.events.register("before-call", before_call)
+    client.meta.events.register("after-call", after_call)
+    client.meta.events.register("after-call-error", after_call_error)
+
+
+def instrument_engine(engine):
+    """Times every statement executed through the engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("nimbly_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = time.perf_counter() - conn.info["nimbly_started"].pop()
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement else "?"
+        DB_QUERY_LATENCY.labels(kind).observe(elapsed)
+        record("db", elapsed)
+
+
+class MetricsMiddleware:
+    """ASGI middleware observing request latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Label by template, not raw path, to keep cardinality bounded.
+            path = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], path, str(status)).observe(
+                time.perf_counter() - started
+            )
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+
+from app.services.metrics import SYNC_FAILURES
+
+logger = logging.getLogger(__name__)
+
+_sync_locks = {}
+
+
+def sync_lock(sync: str, key):
+    """The lock serializing this worker's `sync` runs for `key`."""
+    return _sync_locks.setdefault((sync, key), asyncio.Lock())
+
+
+def sync_failed(sync: str, target=None):
+    """Counts and logs the exception being handled as a failed `sync`."""
+    SYNC_FAILURES.labels(sync).inc()
+    logger.warning(
+        "%s sync failed%s", sync, f" for {target}" if target else "", exc_info=True
+    )
+
+
+class PeriodicTask:
+    """
+    Background task awaiting `tick` every `interval` seconds until stopped.
+    A tick that raises is recorded as a failed `name` sync; the next one
+    retries.
+    """
+
+    def __init__(self, name: str, interval: float):
+        self.name = name
+        self.interval = interval
+        self._task = None
+
+    async def tick(self):
+        raise NotImplementedError
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception:
+                sync_failed(self.name)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,227 @@
+import functools
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Share of requests profiled without being asked to, e.g. 0.001.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.002"))
+PROFILE_STORE_SIZE = int(os.getenv("PROFILE_STORE_SIZE", "100"))
+
+_current = ContextVar("nimbly_profile", default=None)
+# Most recent profiles, newest last.
+profiles = deque(maxlen=PROFILE_STORE_SIZE)
+
+
+class Profile:
+    """
+    Phase timings and stack samples for one request. Phases are recorded
+    from whichever thread does the work, as the profile travels with the
+    request's context into the AWS executor.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, path: str):
+        self.id = next(self._ids)
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started_at = time.time()
+        self.total = 0.0
+        self.phases = []
+        self.stacks = Counter()
+        self.threads = {}
+        self._started = time.perf_counter()
+        self._loop_thread = threading.get_ident()
+        self._done = threading.Event()
+        threading.Thread(
+            target=self._sample, name="nimbly-profiler", daemon=True
+        ).start()
+
+    def record(self, phase: str, seconds: float):
+        self.phases.append((phase, seconds))
+
+    def traced(self, fn):
+        """Wraps `fn` so the sampler follows the worker thread running it."""
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            ident = threading.get_ident()
+            self.threads[ident] = self.threads.get(ident, 0) + 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.threads[ident] -= 1
+                if not self.threads[ident]:
+                    del self.threads[ident]
+
+        return run
+
+    def _sample(self):
+        # The event loop is shared, so its samples can include other requests
+        # running concurrently; executor samples are this request's alone.
+        while not self._done.wait(PROFILE_INTERVAL):
+            frames = sys._current_frames()
+            self._add(frames.get(self._loop_thread), "event-loop")
+            for ident in list(self.threads):
+                self._add(frames.get(ident), "aws-executor")
+
+    def _add(self, frame, root: str):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            name = os.path.basename(code.co_filename)
+            stack.append(f"{code.co_name} ({name}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            stack.append(root)
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def finish(self, status: int):
+        self.status = status
+        self.total = time.perf_counter() - self._started
+        # The sampler exits on its own; waiting for it would block the loop.
+        self._done.set()
+
+    def breakdown(self):
+        """Milliseconds per phase, summed over every time the phase ran."""
+        spent = {}
+        for phase, seconds in list(self.phases):
+            spent[phase] = spent.get(phase, 0) + seconds * 1000
+        return {phase: round(ms, 3) for phase, ms in spent.items()}
+
+    def server_timing(self):
+        phases = self.breakdown()
+        phases["total"] = round((time.perf_counter() - self._started) * 1000, 3)
+        return ", ".join(f"{phase};dur={ms}" for phase, ms in phases.items())
+
+    def folded(self):
+        """Samples in collapsed-stack form, as read by flamegraph.pl or speedscope."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.items())
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "total_ms": round(self.total * 1000, 3),
+            "phases": self.breakdown(),
+            "samples": sum(self.stacks.values()),
+        }
+
+
+class _Span:
+    __slots__ = ("profile", "phase", "started")
+
+    def __init__(self, profile: Profile, phase: str):
+        self.profile = profile
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profile.record(self.phase, time.perf_counter() - self.started)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def current_profile():
+    return _current.get()
+
+
+def span(phase: str):
+    """Times a block as `phase` of the current request's profile, if any."""
+    profile = _current.get()
+    return _NO_SPAN if profile is None else _Span(profile, phase)
+
+
+def record(phase: str, seconds: float):
+    profile = _current.get()
+    if profile is not None:
+        profile.record(phase, seconds)
+
+
+def _wants_profile(headers: list):
+    asked = token = None
+    for name, value in headers:
+        if name == b"x-profile":
+            asked = value
+        elif name == b"x-admin-token":
+            token = value
+    if asked is None or not ADMIN_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token, ADMIN_TOKEN.encode())
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests that carry `X-Profile` with a valid
+    `X-Admin-Token`, plus a PROFILE_SAMPLE_RATE share of the rest. Responses
+    to the former get a Server-Timing breakdown and an X-Profile-Id to fetch
+    the stored profile by; sampled profiles only go to the store. Requests
+    that are not profiled pay for one header scan.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        asked = _wants_profile(scope["headers"])
+        if not (
+            asked or (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE)
+        ):
+            return await self.app(scope, receive, send)
+
+        profile = Profile(scope["method"], scope["path"])
+        token = _current.set(profile)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if asked:
+                    # Phase timings are internal; only admins asking see them.
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", profile.server_timing().encode()),
+                        (b"x-profile-id", str(profile.id).encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            profile.finish(status)
+            profiles.append(profile)
+
+
+def get_profile(profile_id: int):
+    for profile in list(profiles):
+        if profile.id == profile_id:
+            return profile
+    return None
@@ -0,0 +1,249 @@
+import functools
+import ipaddress
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from app.services.cache import make_cache
+from app.services.clients import credential_fingerprint, get_client
+
+# Changes made outside this API are picked up by a full rebuild this often.
+RULE_INDEX_TTL = float(os.getenv("RULE_INDEX_TTL_SECONDS", "300"))
+
+# describe_security_group_rules reports protocol numbers for some rules.
+PROTOCOLS = {"6": "tcp", "17": "udp", "1": "icmp", "58": "icmpv6"}
+# Only these protocols have ports; for the rest FromPort/ToPort mean something else.
+PORTED = {"tcp", "udp"}
+ALL_PORTS = (0, 65535)
+
+
+def flatten_rule(rule: dict):
+    protocol = rule["IpProtocol"]
+    return {
+        "rule_id": rule["SecurityGroupRuleId"],
+        "group_id": rule["GroupId"],
+        "direction": "egress" if rule["IsEgress"] else "ingress",
+        "protocol": PROTOCOLS.get(protocol, protocol),
+        "from_port": rule.get("FromPort"),
+        "to_port": rule.get("ToPort"),
+        "cidr": rule.get("CidrIpv4") or rule.get("CidrIpv6"),
+        "referenced_group_id": rule.get("ReferencedGroupInfo", {}).get("GroupId"),
+        "prefix_list_id": rule.get("PrefixListId"),
+        "description": rule.get("Description"),
+    }
+
+
+def fetch_rules(ec2, gid: str = None):
+    """Every rule in the region, or in one group, flattened."""
+    filters = [{"Name": "group-id", "Values": [gid]}] if gid else []
+    pages = ec2.get_paginator("describe_security_group_rules").paginate(Filters=filters)
+    return [flatten_rule(r) for page in pages for r in page["SecurityGroupRules"]]
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_network(cidr: str):
+    return ipaddress.ip_network(cidr, strict=False)
+
+
+class RuleBucket:
+    """
+    The rules of one direction and protocol, indexed two ways:
+
+    - ports, as a segment tree over the sorted range boundaries: each range
+      is stored on O(log n) nodes, and a port's rules are the ones met on its
+      leaf-to-root path;
+    - CIDRs, keyed by (version, prefix length, network bits), so the rules
+      covering a network are one dict probe per shorter prefix, plus a sorted
+      list of network starts for the rules inside it.
+    """
+
+    def __init__(self, rules: list[dict]):
+        self.rules = rules
+        self.any_port = set()
+        self.points = []
+        self.nodes = {}
+        self.prefixes = {}
+        self.starts = {4: [], 6: []}
+
+        ranges = []
+        for i, rule in enumerate(rules):
+            low, high = rule["from_port"], rule["to_port"]
+            if rule["protocol"] not in PORTED or low is None or low < 0:
+                self.any_port.add(i)
+            elif (low, high) == ALL_PORTS:
+                self.any_port.add(i)
+            else:
+                ranges.append((low, high, i))
+
+            if rule["cidr"] is None:
+                continue
+            network = parse_network(rule["cidr"])
+            key = self._prefix_key(network, network.prefixlen)
+            self.prefixes.setdefault(key, []).append(i)
+            self.starts[network.version].append(
+                (int(network.network_address), network.prefixlen, i)
+            )
+
+        self.points = sorted({p for low, high, _ in ranges for p in (low, high + 1)})
+        self.size = len(self.points)
+        for low, high, i in ranges:
+            left = bisect_left(self.points, low) + self.size
+            right = bisect_left(self.points, high + 1) + self.size
+            while left < right:
+                if left & 1:
+                    self.nodes.setdefault(left, []).append(i)
+                    left += 1
+                if right & 1:
+                    right -= 1
+                    self.nodes.setdefault(right, []).append(i)
+                left >>= 1
+                right >>= 1
+        for starts in self.starts.values():
+            starts.sort()
+
+    @staticmethod
+    def _prefix_key(network, length: int):
+        bits = network.max_prefixlen - length
+        return (network.version, length, int(network.network_address) >> bits)
+
+    def by_port(self, port: int):
+        found = set(self.any_port)
+        node = bisect_right(self.points, port) - 1
+        if node < 0:
+            return found
+        node += self.size
+        while node:
+            found.update(self.nodes.get(node, ()))
+            node >>= 1
+        return found
+
+    def by_cidr(self, network, overlaps: bool):
+        # Rules whose CIDR contains the whole of `network`.
+        found = set()
+        for length in range(network.prefixlen + 1):
+            found.update(self.prefixes.get(self._prefix_key(network, length), ()))
+        if overlaps:
+            # Plus rules whose CIDR lies inside it.
+            starts = self.starts[network.version]
+            low = bisect_left(starts, (int(network.network_address),))
+            high = bisect_right(starts, (int(network.broadcast_address), 129))
+            found.update(
+                i for _, length, i in starts[low:high] if length >= network.prefixlen
+            )
+        return found
+
+    def match(self, port: int = None, network=None, overlaps: bool = False):
+        matched = set(range(len(self.rules))) if port is None else self.by_port(port)
+        if network is not None:
+            matched &= self.by_cidr(network, overlaps)
+        return [self.rules[i] for i in sorted(matched)]
+
+
+class RuleIndex:
+    """
+    All security group rules of one account and region. Rules are kept per
+    group, so a group changed through the API is refetched on its own; only
+    the (direction, protocol) buckets it touches are rebuilt, on next query.
+    """
+
+    def __init__(self, rules: list[dict]):
+        self.built_at = time.time()
+        self._groups = {}
+        for rule in rules:
+            self._groups.setdefault(rule["group_id"], []).append(rule)
+        self._buckets = {}
+        self._dirty = {(r["direction"], r["protocol"]) for r in rules}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(rules) for rules in self._groups.values())
+
+    def replace_group(self, gid: str, rules: list[dict]):
+        with self._lock:
+            for rule in self._groups.pop(gid, []) + rules:
+                self._dirty.add((rule["direction"], rule["protocol"]))
+            if rules:
+                self._groups[gid] = rules
+
+    def _bucket(self, key: tuple):
+        if key in self._dirty:
+            rules = [
+                rule
+                for group in self._groups.values()
+                for rule in group
+                if (rule["direction"], rule["protocol"]) == key
+            ]
+            self._buckets[key] = RuleBucket(rules)
+            self._dirty.discard(key)
+        return self._buckets.get(key)
+
+    def query(
+        self,
+        direction: str = "ingress",
+        protocol: str = "tcp",
+        port: int = None,
+        cidr: str = None,
+        overlaps: bool = False,
+    ):
+        """
+        Rules that let `protocol`/`port` through in `direction` for `cidr`.
+        By default a rule matches when its CIDR covers the whole of `cidr`;
+        with `overlaps` it also matches when it covers any part of it. Rules
+        naming a group or prefix list have no CIDR and only match without one.
+        """
+        network = parse_network(cidr) if cidr else None
+        if protocol not in PORTED:
+            port = None
+        matched = []
+        with self._lock:
+            for proto in dict.fromkeys((protocol, "-1")):
+                bucket = self._bucket((direction, proto))
+                if bucket is not None:
+                    matched.extend(bucket.match(port, network, overlaps))
+        return matched
+
+
+class RuleIndexes:
+    """One RuleIndex per (credential fingerprint, region), built on first use."""
+
+    def __init__(self):
+        # Indexes are live objects: only their invalidations are shared.
+        self.cache = make_cache(
+            "rule_indexes", maxsize=256, ttl=RULE_INDEX_TTL, share_values=False
+        )
+
+    def get(self, user: dict, region: str = None):
+        region = region or user["region"]
+
+        def load():
+            return RuleIndex(fetch_rules(get_client(user, "ec2", region=region)))
+
+        return self.cache.get_or_load((credential_fingerprint(user), region), load)
+
+    def group_changed(self, user: dict, gid: str, region: str = None):
+        """Refetches one group's rules into this worker's index, if built."""
+        key = (credential_fingerprint(user), region or user["region"])
+        index = self.cache.get(key)
+        # Other workers can't patch their copies; this makes them rebuild.
+        self.cache.delete(key)
+        if index is None:
+            return
+        try:
+            ec2 = get_client(user, "ec2", region=key[1])
+            index.replace_group(gid, fetch_rules(ec2, gid))
+        except Exception:
+            # Better a full rebuild on next query than a silently stale index.
+            return
+        self.cache.set(key, index)
+
+    def group_deleted(self, user: dict, gid: str, region: str = None):
+        key = (credential_fingerprint(user), region or user["region"])
+        index = self.cache.get(key)
+        self.cache.delete(key)
+        if index is not None:
+            index.replace_group(gid, [])
+            self.cache.set(key, index)
+
+
+rule_indexes = RuleIndexes()
@@ -0,0 +1,98 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from app.services.clients import credential_fingerprint
+from app.services.metrics import COALESCED
+
+COALESCE_LINGER_SECONDS = float(os.getenv("COALESCE_LINGER_SECONDS", "0"))
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution whose
+    result (or exception) is handed to every caller. With `linger`, a finished
+    result keeps answering identical calls for that many seconds.
+    """
+
+    def __init__(self, linger: float = COALESCE_LINGER_SECONDS):
+        self.linger = linger
+        self._inflight = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, operation: str = ""):
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is not None:
+                if time.monotonic() < recent[1]:
+                    COALESCED.labels(operation, "linger").inc()
+                    return recent[0]
+                del self._recent[key]
+
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if not owner:
+            COALESCED.labels(operation, "inflight").inc()
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+            if self.linger > 0:
+                self._recent[key] = (result, time.monotonic() + self.linger)
+                self._prune()
+        future.set_result(result)
+        return result
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, (_, expires) in self._recent.items() if expires <= now]:
+            del self._recent[key]
+
+
+flights = SingleFlight()
+
+
+def coalesced(operation: str):
+    """
+    Shares one upstream call between identical concurrent reads, keyed by
+    (account fingerprint, region, operation, normalized arguments).
+
+    Callers receive the same result object and must not mutate it.
+    """
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            user = params.pop("user")
+            key = (
+                credential_fingerprint(user),
+                user["region"],
+                operation,
+                json.dumps(params, sort_keys=True, default=str),
+            )
+            return flights.do(key, lambda: fn(*args, **kwargs), operation)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from botocore.exceptions import ClientError
+
+from app.services.clients import credential_fingerprint, get_client
+from app.services.governor import RateLimited
+from app.services.metrics import THROTTLE_CODES, WAITER_ACCOUNTS, WAITER_PENDING
+
+WAITER_POLL_INTERVAL = float(os.getenv("WAITER_POLL_INTERVAL_SECONDS", "5"))
+WAITER_TIMEOUT = float(os.getenv("WAITER_TIMEOUT_SECONDS", "600"))
+# EC2 caps the number of values in a single filter.
+FILTER_CHUNK_SIZE = 200
+
+# The failure states of boto's instance_running / instance_stopped /
+# instance_terminated waiters. "stopped" is not one for "running": right
+# after start_instances, describe_instances can still report it.
+FAILURE_STATES = {
+    "running": {"shutting-down", "terminated", "stopping"},
+    "stopped": {"pending", "terminated"},
+    "terminated": {"pending", "stopping"},
+}
+
+
+class StateError(Exception):
+    """An instance settled in a state from which it can't reach the target."""
+
+    def __init__(self, instance: dict, target: str):
+        self.instance = instance
+        self.state = instance["State"]["Name"]
+        reason = instance.get("StateReason", {}).get("Message")
+        super().__init__(reason or f"Instance is {self.state}, expected {target}")
+
+
+class AccountWaiter:
+    """
+    Polls every instance any caller is waiting on in one account and region,
+    with one describe_instances call per chunk of IDs per tick. The polling
+    thread starts with the first wait and exits once nothing is pending.
+    """
+
+    def __init__(self, user: dict, region: str):
+        self.user = user
+        self.region = region
+        # iid -> list of (target, future, deadline)
+        self._waits = {}
+        self._lock = threading.Lock()
+        self._running = False
+
+    def add(self, iid: str, target: str, timeout: float):
+        future = Future()
+        with self._lock:
+            self._waits.setdefault(iid, []).append(
+                (target, future, time.monotonic() + timeout)
+            )
+            if not self._running:
+                self._running = True
+                threading.Thread(
+                    target=self._run, name="nimbly-waiter", daemon=True
+                ).start()
+        return future
+
+    def pending(self):
+        return sum(len(waits) for waits in self._waits.values())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._expire()
+                if not self._waits:
+                    self._running = False
+                    return
+                ids = list(self._waits)
+
+            try:
+                instances = self._describe(ids)
+            except RateLimited:
+                # Out of local budget: skip this tick, the waits stay queued.
+                instances = None
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in THROTTLE_CODES:
+                    self._fail_all(ids, e)
+                instances = None
+            except Exception as e:
+                self._fail_all(ids, e)
+                instances = None
+
+            if instances is not None:
+                self._resolve(instances)
+            time.sleep(WAITER_POLL_INTERVAL)
+
+    def _describe(self, ids: list[str]):
+        # A filter, unlike InstanceIds, doesn't fail the whole call when one
+        # caller's ID is unknown or not yet visible.
+        ec2 = get_client(self.user, service="ec2", region=self.region)
+        paginator = ec2.get_paginator("describe_instances")
+        instances = {}
+        for i in range(0, len(ids), FILTER_CHUNK_SIZE):
+            chunk = ids[i : i + FILTER_CHUNK_SIZE]
+            pages = paginator.paginate(
+                Filters=[{"Name": "instance-id", "Values": chunk}]
+            )
+            for page in pages:
+                for reservation in page["Reservations"]:
+                    for instance in reservation["Instances"]:
+                        instances[instance["InstanceId"]] = instance
+        return instances
+
+    def _resolve(self, instances: dict):
+        with self._lock:
+            for iid, instance in instances.items():
+                state = instance["State"]["Name"]
+                remaining = []
+                for target, future, deadline in self._waits.get(iid, []):
+                    if state == target:
+                        future.set_result(instance)
+                    elif state in FAILURE_STATES[target]:
+                        future.set_exception(StateError(instance, target))
+                    else:
+                        remaining.append((target, future, deadline))
+                self._update(iid, remaining)
+
+    def _expire(self):
+        now = time.monotonic()
+        for iid in list(self._waits):
+            remaining = []
+            for target, future, deadline in self._waits[iid]:
+                if now >= deadline:
+                    future.set_exception(TimeoutError(f"Instance not {target} in time"))
+                else:
+                    remaining.append((target, future, deadline))
+            self._update(iid, remaining)
+
+    def _fail_all(self, ids: list[str], error: Exception):
+        with self._lock:
+            for iid in ids:
+                for _, future, _ in self._waits.pop(iid, []):
+                    future.set_exception(error)
+
+    def _update(self, iid: str, remaining: list):
+        if remaining:
+            self._waits[iid] = remaining
+        else:
+            self._waits.pop(iid, None)
+
+
+class WaiterService:
+    """Shares one AccountWaiter per (credential fingerprint, region)."""
+
+    def __init__(self):
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def wait(
+        self,
+        user: dict,
+        iids: list[str],
+        target: str,
+        region: str = None,
+        timeout: float = WAITER_TIMEOUT,
+    ):
+        """
+        Returns {iid: Future} for each instance. A future resolves to the raw
+        instance description once it reaches `target`, or fails with
+        StateError, TimeoutError or the error that broke polling.
+        """
+        region = region or user["region"]
+        key = (credential_fingerprint(user), region)
+        with self._lock:
+            waiter = self._waiters.get(key)
+            if waiter is None:
+                # Drop idle waiters first, so the registry only holds accounts
+                # with something pending.
+                for k in [k for k, w in self._waiters.items() if not w._running]:
+                    del self._waiters[k]
+                waiter = self._waiters[key] = AccountWaiter(user, region)
+            # Registering under the service lock keeps another account's
+            # call from pruning this waiter before it has started polling.
+            return {
+                iid: waiter.add(iid, target, timeout) for iid in dict.fromkeys(iids)
+            }
+
+    def observe(self):
+        """Samples how many accounts are being polled and how many waits are open."""
+        with self._lock:
+            waiters = list(self._waiters.values())
+        WAITER_ACCOUNTS.set(sum(1 for w in waiters if w._running))
+        WAITER_PENDING.set(sum(w.pending() for w in waiters))
+
+
+waiter_service = WaiterService()
@@ -0,0 +1,157 @@
+"""
+Cold-start report.
+
+Starts fresh interpreters and measures how long importing the app, running
+its lifespan startup and serving the first request to each route take, with
+and without pre-warmed botocore models. Also breaks the import time down by
+package, from `python -X importtime`.
+
+    python -m benchmarks.coldstart --runs 5 --output coldstart.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.env import configure
+
+REGION = "us-east-1"
+ROUTES = ["/", "/instances/identify", "/instances/", "/instances/keypair"]
+MODES = {"cold": "", "prewarm": "ec2,sts"}
+
+
+async def measure_requests(app):
+    import httpx
+
+    timings = {}
+    transport = httpx.ASGITransport(app=app)
+
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        timings["startup_ms"] = (time.perf_counter() - started) * 1000
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://coldstart", timeout=None
+        ) as client:
+            started = time.perf_counter()
+            response = await client.post(
+                "/auth/register",
+                json={
+                    "aws_access_key_id": "AKIACOLD",
+                    "aws_secret_access_key": "cold",
+                    "region": REGION,
+                },
+            )
+            timings["POST /auth/register"] = (time.perf_counter() - started) * 1000
+            headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+            for route in ROUTES:
+                for attempt in ("first", "second"):
+                    started = time.perf_counter()
+                    response = await client.get(route, headers=headers)
+                    response.raise_for_status()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    timings[f"GET {route} ({attempt})"] = elapsed
+    return timings
+
+
+def child():
+    configure()
+    started = time.perf_counter()
+    from app.main import app
+
+    timings = {"import_ms": (time.perf_counter() - started) * 1000}
+
+    import boto3
+    from moto import mock_aws
+
+    with mock_aws():
+        # Warm moto's backends through boto3's own session, which does not
+        # share the app's loader, so only the app's cold path is measured.
+        boto3.client("ec2", region_name=REGION).describe_instances()
+        boto3.client("sts", region_name=REGION).get_caller_identity()
+        timings.update(asyncio.run(measure_requests(app)))
+    print(json.dumps(timings))
+
+
+def run_child(prewarm: str):
+    env = dict(os.environ, AWS_PREWARM_SERVICES=prewarm)
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.coldstart", "--child"],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(limit: int):
+    """Import time of `app.main` summed per top-level package, slowest first."""
+    configure()
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line.split(":", 1)[1].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1000
+    return sorted(packages.items(), key=lambda p: p[1], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--imports", type=int, default=10, help="packages to list")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child()
+
+    results = {}
+    for mode, prewarm in MODES.items():
+        runs = [run_child(prewarm) for _ in range(args.runs)]
+        results[mode] = {
+            name: round(statistics.median(r[name] for r in runs), 2) for name in runs[0]
+        }
+
+    print(
+        f"{'median of ' + str(args.runs) + ' runs (ms)':40} "
+        + " ".join(f"{mode:>10}" for mode in MODES)
+    )
+    for name in results["cold"]:
+        print(
+            f"{name:40} " + " ".join(f"{results[mode][name]:>10.1f}" for mode in MODES)
+        )
+
+    imports = slowest_imports(args.imports)
+    print("\nimport time of app.main by package (ms)")
+    for name, ms in imports:
+        print(f"{name:40} {ms:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"runs": args.runs, "results": results, "imports": dict(imports)},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import uuid
+
+from cryptography.fernet import Fernet
+
+# Every benchmark request comes from one account; admission caps sized for
+# many tenants would turn the run into a measurement of 429s.
+ADMISSION_CAP = 1024
+
+
+def configure():
+    """
+    Points the app at a throwaway SQLite database and fake AWS credentials,
+    and lifts admission control out of the way of up to `ADMISSION_CAP`
+    concurrent requests. Must run before anything under `app` is imported.
+    """
+    tmpdir = tempfile.mkdtemp(prefix="nimbly-bench-")
+    os.environ.update(
+        {
+            "DB_URL": f"sqlite:///{tmpdir}/bench.db",
+            "FERNET_SECRET_KEY": Fernet.generate_key().decode(),
+            "JWT_SECRET_KEY": uuid.uuid4().hex * 2,
+            "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+            "REFRESH_TOKEN_EXPIRE_DAYS": "1",
+            "INVENTORY_SYNC_ENABLED": "false",
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+        }
+    )
+    for pool in ("READ", "MUTATE"):
+        for setting in ("LIMIT", "PER_ACCOUNT", "QUEUE"):
+            os.environ[f"ADMISSION_{pool}_{setting}"] = str(ADMISSION_CAP)
+    return tmpdir
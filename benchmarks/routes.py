@@ -0,0 +1,296 @@
+"""
+Offline route benchmarks.
+
+Runs the FastAPI app in-process through httpx's ASGITransport against a moto
+stand-in for AWS (with injected latency) and a throwaway SQLite database, and
+reports p50/p95/p99 latency and throughput per route and concurrency level.
+
+    python -m benchmarks.routes --output bench.json
+    python -m benchmarks.routes --compare bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import uuid
+
+from benchmarks.env import ADMISSION_CAP, configure
+
+configure()
+
+import botocore.handlers  # noqa: E402
+import httpx  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+REGION = "us-east-1"
+AWS_LATENCY = 0.0
+
+
+def inject_latency(**kwargs):
+    if AWS_LATENCY:
+        time.sleep(AWS_LATENCY)
+
+
+# Registered as a builtin so every client the app builds picks it up.
+botocore.handlers.BUILTIN_HANDLERS.append(("before-call", inject_latency))
+
+
+def percentile(samples: list[float], q: float):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def seed(client: httpx.AsyncClient, instances: int):
+    import boto3
+
+    response = await client.post(
+        "/auth/register",
+        json={
+            "aws_access_key_id": "AKIABENCH",
+            "aws_secret_access_key": "bench",
+            "region": REGION,
+        },
+    )
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    ec2 = boto3.client("ec2", region_name=REGION)
+    image_id = ec2.describe_images(Owners=["amazon"])["Images"][0]["ImageId"]
+    group_id = ec2.create_security_group(GroupName="bench", Description="bench")[
+        "GroupId"
+    ]
+    ec2.create_key_pair(KeyName="bench")
+    reservation = ec2.run_instances(
+        ImageId=image_id, MinCount=instances, MaxCount=instances
+    )
+    instance_id = reservation["Instances"][0]["InstanceId"]
+    # The image catalog is built in the background on first read.
+    while (await client.get("/instances/images", headers=headers)).status_code == 503:
+        await asyncio.sleep(0.1)
+    return headers, {"image_id": image_id, "group_id": group_id, "iid": instance_id}
+
+
+def scenarios(ctx: dict):
+    """(name, method, path factory, json body factory) for every route."""
+    unique = lambda: uuid.uuid4().hex[:12]  # noqa: E731
+    return [
+        ("GET /", "GET", lambda: "/", None),
+        ("GET /instances/identify", "GET", lambda: "/instances/identify", None),
+        ("GET /instances/", "GET", lambda: "/instances/", None),
+        (
+            "GET /instances/?source=local",
+            "GET",
+            lambda: "/instances/?source=local",
+            None,
+        ),
+        ("GET /instances/images", "GET", lambda: "/instances/images", None),
+        ("GET /instances/keypair", "GET", lambda: "/instances/keypair", None),
+        (
+            "GET /instances/security-group",
+            "GET",
+            lambda: "/instances/security-group",
+            None,
+        ),
+        (
+            "GET /instances/security-group/{id}",
+            "GET",
+            lambda: f"/instances/security-group/{ctx['group_id']}",
+            None,
+        ),
+        (
+            "POST /instances/{id}/stop",
+            "POST",
+            lambda: f"/instances/{ctx['iid']}/stop",
+            None,
+        ),
+        (
+            "POST /instances/{id}/start",
+            "POST",
+            lambda: f"/instances/{ctx['iid']}/start",
+            None,
+        ),
+        (
+            "POST /instances/batch/stop",
+            "POST",
+            lambda: "/instances/batch/stop",
+            lambda: {"instance_ids": [ctx["iid"]]},
+        ),
+        (
+            "POST /instances/",
+            "POST",
+            lambda: "/instances/",
+            lambda: {
+                "instance_type": "t2.micro",
+                "ami_id": ctx["image_id"],
+                "key_name": "bench",
+                "security_group_id": ctx["group_id"],
+                "region": REGION,
+            },
+        ),
+        (
+            "POST /instances/keypair",
+            "POST",
+            lambda: "/instances/keypair",
+            lambda: {"key_name": f"bench-{unique()}"},
+        ),
+        (
+            "POST /instances/security-group",
+            "POST",
+            lambda: "/instances/security-group",
+            lambda: {
+                "group_name": f"bench-{unique()}",
+                "description": "bench",
+                "rules": [{"port": 22}, {"port": 443}],
+            },
+        ),
+        (
+            "POST /auth/register",
+            "POST",
+            lambda: "/auth/register",
+            lambda: {
+                "aws_access_key_id": f"AKIA{unique()}",
+                "aws_secret_access_key": unique(),
+                "region": REGION,
+            },
+        ),
+    ]
+
+
+async def measure(client, headers, method, path, body, requests, concurrency):
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.request(
+                method, path(), headers=headers, json=body() if body else None
+            )
+            # A fast rejection isn't a fast route: only successes are timed.
+            if response.is_success:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if not latencies:
+        raise RuntimeError(f"{method} {path()}: all {requests} requests failed")
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+    }
+
+
+async def run(args):
+    from app.main import app
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            headers, ctx = await seed(client, args.instances)
+            for name, method, path, body in scenarios(ctx):
+                if args.only and args.only not in name:
+                    continue
+                results[name] = {}
+                for concurrency in args.concurrency:
+                    stats = await measure(
+                        client, headers, method, path, body, args.requests, concurrency
+                    )
+                    results[name][str(concurrency)] = stats
+                    print(
+                        f"{name:40} c={concurrency:<4} "
+                        f"p50={stats['p50_ms']:>9.2f}ms p95={stats['p95_ms']:>9.2f}ms "
+                        f"p99={stats['p99_ms']:>9.2f}ms {stats['throughput_rps']:>8.1f} rps"
+                        + (f" errors={stats['errors']}" if stats["errors"] else "")
+                    )
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Prints p95 changes against a baseline; returns True if any regressed."""
+    regressed = False
+    for name, levels in results.items():
+        for concurrency, stats in levels.items():
+            before = baseline.get("results", {}).get(name, {}).get(concurrency)
+            if not before or not before["p95_ms"]:
+                continue
+            change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+            flag = ""
+            if change > threshold:
+                flag, regressed = "  REGRESSION", True
+            print(
+                f"{name:40} c={concurrency:<4} p95 {before['p95_ms']:>9.2f} -> "
+                f"{stats['p95_ms']:>9.2f}ms ({change:+.1f}%){flag}"
+            )
+    return regressed
+
+
+def main():
+    global AWS_LATENCY
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--instances", type=int, default=50)
+    parser.add_argument(
+        "--aws-latency-ms", type=float, default=20, help="added to every AWS call"
+    )
+    parser.add_argument("--only", help="run routes whose name contains this")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare p95 against")
+    parser.add_argument("--threshold", type=float, default=10, help="percent")
+    args = parser.parse_args()
+    if max(args.concurrency) > ADMISSION_CAP:
+        parser.error(f"concurrency is capped at {ADMISSION_CAP} by admission control")
+
+    AWS_LATENCY = args.aws_latency_ms / 1000
+
+    with mock_aws():
+        results = asyncio.run(run(args))
+
+    report = {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "instances": args.instances,
+            "aws_latency_ms": args.aws_latency_ms,
+        },
+        "results": results,
+    }
+    failed = [
+        f"{name} c={concurrency}: {stats['errors']}/{stats['requests']}"
+        for name, levels in results.items()
+        for concurrency, stats in levels.items()
+        if stats["errors"]
+    ]
+    if failed:
+        # Latencies of a run with failures aren't a baseline to compare against.
+        print("Requests failed:\n  " + "\n  ".join(failed), file=sys.stderr)
+        sys.exit(1)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import tempfile
+
+import boto3
+import pytest
+from cryptography.fernet import Fernet
+from moto import mock_aws
+
+# app.database connects on import; give the tests a throwaway database.
+os.environ.setdefault(
+    "DB_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "tests.sqlite")
+)
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-for-the-test-suite")
+os.environ.setdefault("FERNET_SECRET_KEY", Fernet.generate_key().decode())
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ.setdefault("REFRESH_TOKEN_EXPIRE_DAYS", "7")
+
+REGION = "us-east-1"
+
+
+@pytest.fixture
+def ec2():
+    """A moto-backed EC2 client; app clients made meanwhile are mocked too."""
+    from app.services.clients import account_ids, client_pool, failed_account_ids
+    from app.services.fanout import region_cache
+    from app.services.manager import list_cache
+
+    with mock_aws():
+        yield boto3.client("ec2", region_name=REGION)
+    client_pool.clear()
+    list_cache.clear()
+    account_ids.clear()
+    failed_account_ids.clear()
+    region_cache.clear()
+
+
+@pytest.fixture
+def user(ec2):
+    return {
+        "user_id": 1,
+        "access_key": "AKIATEST",
+        "secret_key": "secret",
+        "region": REGION,
+    }
+
+
+@pytest.fixture
+def ami(ec2):
+    # One of moto's built-in images; listing them all takes seconds.
+    return "ami-12c6146b"
+
+
+@pytest.fixture
+def run_db():
+    """Runs `fn(db)` in a fresh event loop against freshly created tables."""
+    from app.database import Base, SessionLocal, engine
+    from app.schemas import auth_request, catalog, inventory  # noqa: F401
+
+    def run(fn):
+        async def main():
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            try:
+                async with SessionLocal() as db:
+                    return await fn(db)
+            finally:
+                # Pooled connections belong to this loop; don't hand them on.
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionPool, Overloaded
+
+
+def test_queued_requests_get_freed_slots_in_order():
+    async def scenario():
+        pool = AdmissionPool("t", limit=1, per_account=5, queue=2, timeout=1)
+        await pool.acquire("a")
+        order = []
+
+        async def queued(account):
+            await pool.acquire(account)
+            order.append(account)
+            pool.release(account, 0.01)
+
+        tasks = [asyncio.create_task(queued(a)) for a in ("b", "c")]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as full:
+            await pool.acquire("d")
+        pool.release("a", 0.01)
+        await asyncio.gather(*tasks)
+        return full.value, order, pool.running
+
+    full, order, running = asyncio.run(scenario())
+    assert (full.status, full.reason) == (503, "queue_full")
+    assert order == ["b", "c"]
+    assert running == 0
+
+
+def test_account_cap_and_queue_timeout():
+    async def scenario():
+        pool = AdmissionPool("t", limit=1, per_account=1, queue=5, timeout=0.05)
+        await pool.acquire("a")
+        with pytest.raises(Overloaded) as capped:
+            await pool.acquire("a")
+        with pytest.raises(Overloaded) as expired:
+            await pool.acquire("b")
+        pool.release("a", 0.01)
+        await pool.acquire("b")
+        return capped.value, expired.value
+
+    capped, expired = asyncio.run(scenario())
+    assert (capped.status, capped.reason) == (429, "account")
+    assert (expired.status, expired.reason) == (503, "timeout")
+    assert expired.retry_after >= 1
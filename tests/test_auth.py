@@ -0,0 +1,103 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.schemas.auth_request import AWS_User
+from app.services import auth
+from app.services.auth import (
+    create_access_token,
+    encrypt_aws_creds,
+    get_aws_fingerprint,
+    get_current_creds,
+)
+from app.services.cache import SQLiteBackend, TTLCache
+
+
+async def add_user(db, region="us-east-1"):
+    user = AWS_User(
+        access_key=encrypt_aws_creds("AKIAAUTH", "secret")[0],
+        access_secret=encrypt_aws_creds("AKIAAUTH", "secret")[1],
+        region=region,
+        aws_fp=get_aws_fingerprint("AKIAAUTH", "secret"),
+    )
+    db.add(user)
+    await db.commit()
+    return user, create_access_token({"sub": str(user.id)})
+
+
+@pytest.fixture
+def shared_principals(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = TTLCache(ttl=60, backend=SQLiteBackend("principals", path=path))
+    monkeypatch.setattr(auth, "principal_cache", cache)
+    return path
+
+
+def test_a_locked_shared_cache_does_not_stall_the_loop(run_db, shared_principals):
+    other_worker = sqlite3.connect(shared_principals, isolation_level=None)
+
+    async def scenario(db):
+        _, token = await add_user(db)
+        other_worker.execute("BEGIN IMMEDIATE")
+
+        async def release():
+            await asyncio.sleep(0.3)
+            other_worker.execute("COMMIT")
+
+        # Storing the principal waits for the lock; on the loop it would
+        # keep release() from ever running.
+        creds, _ = await asyncio.gather(get_current_creds(token, db), release())
+        return creds
+
+    assert run_db(scenario)["access_key"] == "AKIAAUTH"
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_changing_a_user_drops_its_principal(run_db, shared, request):
+    if shared:
+        request.getfixturevalue("shared_principals")
+
+    async def cached(user_id):
+        # Invalidations from a flush on the shared file land off the loop.
+        for _ in range(100):
+            if auth.principal_cache.get(str(user_id)) is None:
+                return None
+            await asyncio.sleep(0.01)
+        return auth.principal_cache.get(str(user_id))
+
+    async def scenario(db):
+        user, token = await add_user(db)
+        await get_current_creds(token, db)
+        assert auth.principal_cache.get(str(user.id))["region"] == "us-east-1"
+
+        user.region = "eu-west-1"
+        await db.commit()
+        after_update = await cached(user.id)
+        assert (await get_current_creds(token, db))["region"] == "eu-west-1"
+
+        await db.delete(user)
+        await db.commit()
+        return after_update, await cached(user.id)
+
+    assert run_db(scenario) == (None, None)
+
+
+def test_an_invalidation_during_the_lookup_is_not_overwritten(run_db, monkeypatch):
+    get_user = auth.get_user
+
+    async def get_user_then_update(db, user_id):
+        user = await get_user(db, user_id)
+        # Another request changes the user while this one holds the old row.
+        auth.invalidate_principal(user_id)
+        return user
+
+    async def scenario(db):
+        user, token = await add_user(db)
+        monkeypatch.setattr(auth, "get_user", get_user_then_update)
+        creds = await get_current_creds(token, db)
+        return creds, auth.principal_cache.get(str(user.id))
+
+    creds, cached = run_db(scenario)
+    assert creds["access_key"] == "AKIAAUTH"
+    assert cached is None
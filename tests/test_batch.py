@@ -0,0 +1,79 @@
+import pytest
+from botocore.exceptions import EndpointConnectionError
+
+from app.services import manager, waiters
+from app.services.governor import RateLimited
+from app.services.manager import batch_instance_action
+
+UNKNOWN = ["i-0123456789abcdef0", "i-00000000000000001", "i-00000000000000002"]
+
+
+@pytest.fixture
+def instances(ec2, ami, monkeypatch):
+    monkeypatch.setattr(waiters, "WAITER_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(manager, "BATCH_CHUNK_SIZE", 2)
+    reservation = ec2.run_instances(ImageId=ami, MinCount=5, MaxCount=5)
+    return [i["InstanceId"] for i in reservation["Instances"]]
+
+
+def failing_calls(monkeypatch, user, error, calls: set):
+    """Makes the given (1-based) stop_instances calls raise `error`."""
+    client = manager.get_ec2_client(user)
+    made = []
+
+    class Client:
+        def __getattr__(self, name):
+            return getattr(client, name)
+
+        def stop_instances(self, **kwargs):
+            made.append(kwargs["InstanceIds"])
+            if len(made) in calls:
+                raise error
+            return client.stop_instances(**kwargs)
+
+    monkeypatch.setattr(manager, "get_ec2_client", lambda user: Client())
+    return made
+
+
+def test_unknown_ids_fail_alone(ec2, user, instances, monkeypatch):
+    made = failing_calls(monkeypatch, user, None, set())
+    # The second chunk mixes a known and an unknown ID, the last is all unknown.
+    ids = instances[:3] + UNKNOWN[:1] + instances[3:] + UNKNOWN[1:]
+
+    result = batch_instance_action("stop", ids, user)
+
+    assert (result["succeeded"], result["failed"]) == (5, 3)
+    states = {r["instance_id"]: r for r in result["results"]}
+    assert all(states[iid]["state"] == "stopped" for iid in instances)
+    for iid in UNKNOWN:
+        assert states[iid]["state"] is None
+        assert "InvalidInstanceID.NotFound" in states[iid]["error"]
+    # Every chunk stays under the limit; only the mixed one is resubmitted.
+    assert max(len(chunk) for chunk in made) == 2
+    assert made[2] == [instances[2]]
+
+
+def test_a_failed_chunk_is_reported_after_earlier_ones_ran(
+    ec2, user, instances, monkeypatch
+):
+    error = EndpointConnectionError(endpoint_url="https://ec2.example")
+    failing_calls(monkeypatch, user, error, {2})
+
+    result = batch_instance_action("stop", instances, user)
+
+    assert (result["succeeded"], result["failed"]) == (3, 2)
+    failed = [r for r in result["results"] if "error" in r]
+    assert [r["instance_id"] for r in failed] == instances[2:4]
+    assert all("Could not connect" in r["error"] for r in failed)
+
+
+def test_throttling_is_raised_only_before_anything_ran(
+    ec2, user, instances, monkeypatch
+):
+    failing_calls(monkeypatch, user, RateLimited("ec2", 1.0), {1})
+    with pytest.raises(RateLimited):
+        batch_instance_action("stop", instances, user)
+
+    failing_calls(monkeypatch, user, RateLimited("ec2", 1.0), {2})
+    result = batch_instance_action("stop", instances, user)
+    assert (result["succeeded"], result["failed"]) == (3, 2)
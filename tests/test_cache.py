@@ -0,0 +1,95 @@
+import threading
+import time
+
+from app.services.cache import SQLiteBackend, TTLCache
+
+
+def test_concurrent_misses_share_one_load():
+    cache = TTLCache(ttl=60)
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(1)
+        return "catalog"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_load("r", loader)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert results == ["catalog"] * 5
+    assert len(calls) == 1
+
+
+def test_stale_entry_is_served_while_refreshing():
+    cache = TTLCache(ttl=0.5, stale_ttl=60)
+    cache.set("r", "old")
+    time.sleep(0.6)
+
+    assert cache.get_or_load("r", lambda: "new") == "old"
+    for _ in range(100):
+        if cache.get("r") == "new":
+            break
+        time.sleep(0.01)
+    assert cache.get_or_load("r", lambda: "newer") == "new"
+
+
+def test_invalidation_forces_reload():
+    cache = TTLCache(ttl=60)
+    cache.set("r", "old")
+    cache.delete("r")
+    assert cache.get_or_load("r", lambda: "new") == "new"
+
+
+def test_sqlite_backend_shares_entries_and_invalidations(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = TTLCache(ttl=60, backend=SQLiteBackend("lists", path=path))
+    second = TTLCache(ttl=60, backend=SQLiteBackend("lists", path=path))
+
+    first.set(("key_pairs", "fp"), {"key_pairs": []})
+    assert second.get_or_load(("key_pairs", "fp"), lambda: "unused") == {
+        "key_pairs": []
+    }
+
+    second.delete(("key_pairs", "fp"))
+    assert first.get(("key_pairs", "fp")) is None
+
+
+def test_invalidation_in_another_worker_beats_a_slow_load(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = TTLCache(ttl=60, backend=SQLiteBackend("vpcs", path=path))
+    second = TTLCache(ttl=60, backend=SQLiteBackend("vpcs", path=path))
+
+    def loader():
+        second.delete("r")
+        return "stale"
+
+    assert first.get_or_load("r", loader) == "stale"
+    assert first.get("r") is None
+
+
+def test_local_values_are_dropped_by_shared_invalidation(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = SQLiteBackend("principals", path=path, share_values=False)
+    second = SQLiteBackend("principals", path=path, share_values=False)
+    first_cache, second_cache = TTLCache(backend=first), TTLCache(backend=second)
+
+    first_cache.set("1", {"secret_key": "s"})
+    assert second_cache.get("1") is None
+    assert first_cache.get("1") == {"secret_key": "s"}
+
+    second_cache.delete("1")
+    assert first_cache.get("1") is None
+
+    first_cache.set("2", "x")
+    second_cache.clear()
+    assert first_cache.get("2") is None
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.database import SessionLocal
+from app.schemas.catalog import Catalog_Sync
+from app.services import catalog, manager
+from app.services.catalog import catalog_syncer, list_catalog_images, sync_region
+from app.services.metrics import AWS_CALLS
+from app.services.serialize import aware
+
+
+@pytest.fixture
+def own_images(ec2, ami, monkeypatch):
+    """Catalogs the account's own images, so the test decides what exists."""
+    monkeypatch.setattr(manager, "AMI_CATALOG_OWNERS", ["self"])
+    iid = ec2.run_instances(ImageId=ami, MinCount=1, MaxCount=1)["Instances"][0][
+        "InstanceId"
+    ]
+
+    def create(name: str):
+        return ec2.create_image(InstanceId=iid, Name=name)["ImageId"]
+
+    return create
+
+
+def test_cold_regions_sync_once_in_the_background(run_db, user, own_images):
+    ids = {own_images(f"app-{n}") for n in range(3)}
+    own_images("other")
+    calls = AWS_CALLS.labels("ec2", "DescribeImages", "ok")
+    before = calls._value.get()
+
+    async def read(limit: int, next_token: str = None, region: str = None):
+        async with SessionLocal() as db:
+            return await list_catalog_images(
+                db, user, region, name="app-", limit=limit, next_token=next_token
+            )
+
+    async def scenario(db):
+        cold = await asyncio.gather(
+            *(read(1) for _ in range(4)), return_exceptions=True
+        )
+        # Concurrent cold reads share the one sync they scheduled.
+        await catalog_syncer.first_sync(user, user["region"])
+        seen, token = [], None
+        while True:
+            page = await read(2, token)
+            seen += [image["image_id"] for image in page["images"]]
+            token = page["next_token"]
+            if token is None:
+                return cold, seen
+
+    cold, seen = run_db(scenario)
+    assert {(e.status_code, e.headers["Retry-After"]) for e in cold} == {(503, "30")}
+    assert calls._value.get() - before == 1
+    assert sorted(seen) == sorted(ids)
+
+    for region, next_token in (("us-east-1", "garbage"), ("xx-nowhere-1", None)):
+        with pytest.raises(HTTPException) as exc:
+            run_db(lambda db: read(1, next_token, region))
+        assert exc.value.status_code == 422
+
+
+def test_only_full_syncs_drop_deregistered_images(run_db, ec2, user, own_images):
+    own_images("kept")
+    dropped = own_images("dropped")
+
+    async def scenario(db):
+        await sync_region(db, user, user["region"], full=True)
+        ec2.deregister_image(ImageId=dropped)
+        await sync_region(db, user, user["region"])
+        after_incremental = (await db.get(Catalog_Sync, user["region"])).image_count
+        await sync_region(db, user, user["region"], full=True)
+        after_full = await db.get(Catalog_Sync, user["region"], populate_existing=True)
+        return after_incremental, after_full.image_count
+
+    assert run_db(scenario) == (2, 1)
+
+
+def test_incremental_syncs_fetch_from_the_watermark(run_db, user, monkeypatch):
+    def image(image_id: str, created: str):
+        return {"image_id": image_id, "name": image_id, "creation_date": created}
+
+    fetched = [
+        [image("ami-old", "2026-09-01T00:00:00+00:00")],
+        # The month-wide filter also returns images older than the watermark.
+        [
+            image("ami-older", "2026-08-01T00:00:00+00:00"),
+            image("ami-new", "2026-09-05T00:00:00+00:00"),
+        ],
+    ]
+    asked = []
+
+    def iter_catalog_images(user, region, since=None):
+        asked.append(since)
+        return fetched[len(asked) - 1]
+
+    monkeypatch.setattr(catalog, "iter_catalog_images", iter_catalog_images)
+
+    async def scenario(db):
+        first = await sync_region(db, user, user["region"])
+        second = await sync_region(db, user, user["region"])
+        sync = await db.get(Catalog_Sync, user["region"], populate_existing=True)
+        listing = await list_catalog_images(db, user, sort="creation_date")
+        return first, second, sync, listing["images"]
+
+    first, second, sync, images = run_db(scenario)
+    assert asked[0] is None
+    assert asked[1].isoformat().startswith("2026-09-01T00:00:00")
+    assert (first, second) == (1, 1)
+    assert aware(sync.watermark).isoformat() == "2026-09-05T00:00:00+00:00"
+    assert [i["image_id"] for i in images] == ["ami-old", "ami-new"]
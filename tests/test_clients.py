@@ -0,0 +1,71 @@
+import pytest
+from botocore.exceptions import EndpointConnectionError
+from moto import mock_aws
+
+from app.services import clients
+from app.services.clients import ClientPool, credential_fingerprint
+from app.services.governor import Governor, RateLimited
+
+USER = {"access_key": "AKIATEST", "secret_key": "secret", "region": "ap-south-1"}
+
+
+def test_client_is_reused_per_account_region_service():
+    pool = ClientPool(maxsize=8, ttl=60)
+    ec2 = pool.get(USER)
+    assert pool.get(USER) is ec2
+    assert pool.get(USER, region="us-east-1") is not ec2
+    assert pool.get(USER, service="sts") is not ec2
+
+
+def test_pool_evicts_least_recently_used_and_expired():
+    pool = ClientPool(maxsize=2, ttl=60)
+    first = pool.get(USER)
+    pool.get(USER, region="us-east-1")
+    pool.get(USER, region="eu-west-1")
+    assert len(pool) == 2
+    assert pool.get(USER) is not first
+
+    expired = ClientPool(maxsize=2, ttl=0)
+    assert expired.get(USER) is not expired.get(USER)
+
+
+def test_evict_drops_every_client_for_fingerprint():
+    pool = ClientPool()
+    other = dict(USER, access_key="AKIAOTHER")
+    pool.get(USER)
+    pool.get(USER, service="sts")
+    pool.get(other)
+    pool.evict(credential_fingerprint(USER))
+    assert len(pool) == 1
+
+
+def test_keys_of_one_account_share_a_governor_budget(monkeypatch):
+    limited = Governor(limits={"describe": (2, 0.01), "mutate": (1, 0.01)}, max_wait=0)
+    monkeypatch.setattr(clients, "governor", limited)
+    other = dict(USER, access_key="AKIAOTHER", region="us-east-1")
+    with mock_aws():
+        pool = ClientPool()
+        # moto puts every key in the same default account.
+        pool.get(dict(USER, region="us-east-1")).describe_instances()
+        pool.get(other).describe_instances()
+        with pytest.raises(RateLimited):
+            pool.get(other).describe_instances()
+
+
+def test_a_failed_account_lookup_is_not_retried_on_every_call(monkeypatch):
+    calls = []
+
+    class UnreachableSTS:
+        def get_caller_identity(self):
+            calls.append(1)
+            raise EndpointConnectionError(endpoint_url="https://sts.example")
+
+    monkeypatch.setattr(clients, "get_client", lambda *a, **kw: UnreachableSTS())
+    user = dict(USER, access_key="AKIAUNREACHABLE")
+    fingerprint = credential_fingerprint(user)
+    try:
+        assert clients.account_id(user) == fingerprint
+        assert clients.account_id(user) == fingerprint
+        assert len(calls) == 1
+    finally:
+        clients.failed_account_ids.clear()
@@ -0,0 +1,70 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.manager import _decode_page_token, describe_instances
+
+
+def token(*parts):
+    return base64.urlsafe_b64encode(json.dumps(parts).encode()).decode()
+
+
+@pytest.fixture
+def launched(ec2, ami):
+    # Three reservations of three: AWS pages by reservation, not instance.
+    return [
+        instance["InstanceId"]
+        for _ in range(3)
+        for instance in ec2.run_instances(ImageId=ami, MinCount=3, MaxCount=3)[
+            "Instances"
+        ]
+    ]
+
+
+def test_pages_resume_inside_a_reservation(user, launched):
+    first = describe_instances(user, limit=2)
+    assert len(first["instances"]) == 2
+    # The smallest page AWS allows, and two of its first reservation taken.
+    assert _decode_page_token(first["next_token"]) == (None, 2, 5)
+
+    # A later request keeps the page size its token was issued for.
+    second = describe_instances(user, limit=4, next_token=first["next_token"])
+    assert len(second["instances"]) == 4
+    assert _decode_page_token(second["next_token"])[2] == 5
+
+    seen = first["instances"] + second["instances"]
+    next_token = second["next_token"]
+    while next_token:
+        page = describe_instances(user, limit=2, next_token=next_token)
+        seen += page["instances"]
+        next_token = page["next_token"]
+    assert [i["instance_id"] for i in seen] == launched
+
+
+def test_unlimited_reads_return_everything(user, launched):
+    result = describe_instances(user)
+    assert [i["instance_id"] for i in result["instances"]] == launched
+    assert result["next_token"] is None
+
+
+@pytest.mark.parametrize(
+    "next_token",
+    [
+        "garbage",
+        "20",
+        token(None, 1.5, 5),
+        token(None, 1, 5.0),
+        token(None, True, 5),
+        token(None, -1, 5),
+        token(None, 0, 4),
+        token(None, 0, 1001),
+        token(7, 0, 5),
+        token(None, 0),
+    ],
+)
+def test_malformed_tokens_are_rejected(user, launched, next_token):
+    with pytest.raises(HTTPException) as exc:
+        describe_instances(user, limit=2, next_token=next_token)
+    assert exc.value.status_code == 422
@@ -0,0 +1,72 @@
+import asyncio
+
+from app.services import events
+from app.services.events import InstanceEvents
+
+
+def test_reconnects_resume_from_history(ec2, ami, user):
+    iid = ec2.run_instances(ImageId=ami, MinCount=1, MaxCount=1)["Instances"][0][
+        "InstanceId"
+    ]
+
+    async def scenario():
+        hub = InstanceEvents()
+        try:
+            first = hub.subscribe(user)
+            snapshot = await first.next(5)
+            ec2.stop_instances(InstanceIds=[iid])
+            hub.wake(user)
+            change = await first.next(5)
+            first.close()
+
+            # Reconnecting with the snapshot's id replays what came after it.
+            resumed = hub.subscribe(user, snapshot["id"])
+            replayed = await resumed.next(1)
+            # An id from another poller's lifetime gets a fresh snapshot.
+            stale = await hub.subscribe(user, "1-1").next(1)
+            return snapshot, change, replayed, stale
+        finally:
+            await hub.stop()
+
+    snapshot, change, replayed, stale = asyncio.run(scenario())
+    assert snapshot["event"] == "snapshot"
+    assert snapshot["data"]["instances"] == {iid: "running"}
+    assert change["event"] == "state"
+    assert change["data"]["instance_id"] == iid
+    assert change["data"]["previous"] == "running"
+    assert replayed == change
+    assert stale["event"] == "snapshot"
+    assert stale["data"]["instances"] == {iid: change["data"]["state"]}
+
+
+def test_slow_subscribers_are_cut_off_then_caught_up(ec2, user, monkeypatch):
+    monkeypatch.setattr(events, "EVENTS_BUFFER_SIZE", 3)
+
+    async def scenario():
+        hub = InstanceEvents()
+        try:
+            subscription = hub.subscribe(user)
+            await subscription.next(5)
+            poller = subscription.poller
+            last_seen = poller.last_id
+            for n in range(4):
+                poller._publish("state", {"instance_id": f"i-{n}"})
+
+            # The buffer held three events; the fourth ends the subscription.
+            cut_off = await subscription.next(1)
+            subscription.close()
+
+            # Four missed events don't fit the buffer either, so replaying
+            # them would only overflow again: the client gets a snapshot.
+            behind = await hub.subscribe(user, last_seen).next(1)
+            # A gap that fits is replayed.
+            close_behind = hub.subscribe(user, f"{poller.epoch}-{poller.seq - 2}")
+            replayed = [await close_behind.next(1) for _ in range(2)]
+            return subscription.overflowed, cut_off, behind, replayed
+        finally:
+            await hub.stop()
+
+    overflowed, cut_off, behind, replayed = asyncio.run(scenario())
+    assert overflowed and cut_off is None
+    assert behind["event"] == "snapshot"
+    assert [e["data"]["instance_id"] for e in replayed] == ["i-2", "i-3"]
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import pytest
+from botocore.exceptions import EndpointConnectionError
+from fastapi import HTTPException
+
+from app.services import fanout
+from app.services.fanout import fan_out, resolve_regions
+from app.services.governor import RateLimited
+
+
+def per_region(user: dict):
+    region = user["region"]
+    if region == "eu-west-1":
+        time.sleep(0.5)
+    elif region == "eu-west-2":
+        raise EndpointConnectionError(endpoint_url=f"https://ec2.{region}")
+    elif region == "eu-west-3":
+        return {"error": "AccessDenied", "message": "Couldn't list instances."}
+    return {"instances": [region]}
+
+
+def test_each_region_fails_on_its_own(monkeypatch):
+    monkeypatch.setattr(fanout, "FANOUT_REGION_TIMEOUT", 0.1)
+    regions = ["us-east-1", "eu-west-1", "eu-west-2", "eu-west-3"]
+
+    results, errors = asyncio.run(fan_out(per_region, {}, regions))
+
+    assert results == {"us-east-1": {"instances": ["us-east-1"]}}
+    assert errors["eu-west-1"] == "Timed out after 0.1s"
+    assert "Could not connect" in errors["eu-west-2"]
+    assert errors["eu-west-3"] == "AccessDenied"
+
+
+def test_a_fully_throttled_fan_out_is_raised():
+    def throttled(user: dict):
+        raise RateLimited("describe", 1.0 if user["region"] == "us-east-1" else 3.0)
+
+    with pytest.raises(RateLimited) as exc:
+        asyncio.run(fan_out(throttled, {}, ["us-east-1", "eu-west-1"]))
+    assert exc.value.retry_after == 3.0
+
+
+def test_region_names_are_validated():
+    names = asyncio.run(resolve_regions({}, "us-east-1, eu-west-1,us-east-1"))
+    assert names == ["us-east-1", "eu-west-1"]
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(resolve_regions({}, "us-east-1,nowhere"))
+    assert exc.value.status_code == 422
+
+
+def test_all_regions_come_from_the_account(ec2, user, monkeypatch):
+    names = asyncio.run(resolve_regions(user, "all"))
+    assert "us-east-1" in names and "eu-west-1" in names
+
+    def unreachable(user):
+        raise EndpointConnectionError(endpoint_url="https://ec2.example")
+
+    monkeypatch.setattr(fanout, "list_regions", unreachable)
+    fanout.region_cache.clear()
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(resolve_regions(user, "all"))
+    assert exc.value.status_code == 502
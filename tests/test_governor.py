@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from app.services.governor import Governor, RateLimited, category
+
+
+def test_operations_are_categorized():
+    assert category("DescribeInstances") == "describe"
+    assert category("GetConsoleOutput") == "describe"
+    assert category("RunInstances") == "mutate"
+    assert category("AuthorizeSecurityGroupIngress") == "mutate"
+
+
+def test_burst_then_reject_with_retry_after():
+    governor = Governor(limits={"describe": (3, 1), "mutate": (1, 1)}, max_wait=0)
+    for _ in range(3):
+        governor.acquire("fp", "us-east-1", "DescribeInstances")
+
+    with pytest.raises(RateLimited) as exc:
+        governor.acquire("fp", "us-east-1", "DescribeInstances")
+    assert 0 < exc.value.retry_after <= 1
+
+    # Other categories, regions and accounts have their own buckets.
+    governor.acquire("fp", "us-east-1", "StopInstances")
+    governor.acquire("fp", "eu-west-1", "DescribeInstances")
+    governor.acquire("other", "us-east-1", "DescribeInstances")
+
+
+def test_short_waits_are_absorbed():
+    governor = Governor(limits={"describe": (1, 20), "mutate": (1, 1)}, max_wait=1)
+    governor.acquire("fp", "us-east-1", "DescribeInstances")
+    started = time.monotonic()
+    governor.acquire("fp", "us-east-1", "DescribeInstances")
+    assert 0.03 < time.monotonic() - started < 0.5
@@ -0,0 +1,121 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event, select
+
+from app.schemas.inventory import EC2_Instance
+from app.services import inventory
+from app.services.inventory import list_local_instances, record_results, sync_account
+
+
+def launch(ec2, ami, count, **tags):
+    params = {"ImageId": ami, "MinCount": count, "MaxCount": count}
+    if tags:
+        tag_list = [{"Key": k, "Value": v} for k, v in tags.items()]
+        params["TagSpecifications"] = [{"ResourceType": "instance", "Tags": tag_list}]
+    return [i["InstanceId"] for i in ec2.run_instances(**params)["Instances"]]
+
+
+def test_sync_mirrors_the_account_and_keeps_users_apart(run_db, ec2, ami, user):
+    iids = launch(ec2, ami, 2)
+    # Another registered user of the same AWS account, with one vanished
+    # instance left over from an earlier sync.
+    other = dict(user, user_id=2)
+
+    async def scenario(db):
+        db.add(
+            EC2_Instance(
+                instance_id="i-0000000000000dead",
+                user_id=user["user_id"],
+                region=user["region"],
+                state="running",
+                last_synced_at=datetime.now(timezone.utc),
+            )
+        )
+        await db.commit()
+        await sync_account(db, user)
+        await sync_account(db, other)
+        rows = (await db.execute(select(EC2_Instance))).scalars().all()
+        return {(r.user_id, r.instance_id, r.state) for r in rows}
+
+    rows = run_db(scenario)
+    expected = {(uid, iid, "running") for uid in (1, 2) for iid in iids}
+    assert rows == expected
+
+
+def test_lifecycle_results_are_written_through(run_db, ec2, ami, user):
+    iid = launch(ec2, ami, 1)[0]
+
+    async def scenario(db):
+        await sync_account(db, user)
+        await record_results(
+            user["user_id"],
+            user["region"],
+            {"results": [{"instance_id": iid, "state": "stopping"}]},
+        )
+        page = await list_local_instances(db, user)
+        return page["instances"]
+
+    instances = run_db(scenario)
+    assert [(i["instance_id"], i["state"]) for i in instances] == [(iid, "stopping")]
+    assert inventory.inventory_syncer._due[(user["user_id"], user["region"])] == 0
+
+
+def test_local_listing_pages_with_and_without_tag_filters(run_db, ec2, ami, user):
+    tagged = set(launch(ec2, ami, 3, env="prod"))
+    launch(ec2, ami, 2)
+
+    async def pages(db, **filters):
+        seen, token = [], None
+        while True:
+            page = await list_local_instances(
+                db, user, limit=2, next_token=token, **filters
+            )
+            assert len(page["instances"]) <= 2
+            seen += [i["instance_id"] for i in page["instances"]]
+            token = page["next_token"]
+            if token is None:
+                return seen
+
+    async def scenario(db):
+        return await pages(db), await pages(db, tag=["env=prod"])
+
+    everything, prod = run_db(scenario)
+    assert len(everything) == len(set(everything)) == 5
+    assert sorted(prod) == sorted(tagged)
+
+
+def test_bad_next_token_is_rejected(run_db, user):
+    async def scenario(db):
+        await list_local_instances(db, user, next_token="garbage")
+
+    with pytest.raises(HTTPException) as exc:
+        run_db(scenario)
+    assert exc.value.status_code == 422
+
+
+def test_an_unchanged_resync_writes_no_rows(run_db, ec2, ami, user):
+    from app.database import engine
+
+    launch(ec2, ami, 2)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    async def scenario(db):
+        await sync_account(db, user)
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            await sync_account(db, user)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+        return (await list_local_instances(db, user))["instances"]
+
+    instances = run_db(scenario)
+    # Only the account's sync record is written.
+    writes = [s for s in statements if s.startswith(("INSERT", "UPDATE", "DELETE"))]
+    assert [s.split()[:3] for s in writes] == [["UPDATE", "inventory_syncs", "SET"]]
+    launched = datetime.fromisoformat(instances[0]["launch_time"])
+    assert launched.tzinfo is not None
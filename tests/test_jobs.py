@@ -0,0 +1,38 @@
+import threading
+
+from app.services.jobs import JobStore
+
+
+def wait_for(store, job_id, owner):
+    for _ in range(200):
+        job = store.get(job_id, owner)
+        if job["finished_at"]:
+            return job
+        threading.Event().wait(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_job_reports_result_and_service_errors():
+    store = JobStore(workers=2, maxsize=10)
+
+    ok = store.submit(
+        1, "stop", lambda iid: {"instance_id": iid, "state": "stopped"}, iid="i-1"
+    )
+    assert ok["status"] == "queued"
+    assert wait_for(store, ok["job_id"], 1)["status"] == "succeeded"
+
+    failed = store.submit(1, "stop", lambda: {"error": "boom", "message": "nope"})
+    assert wait_for(store, failed["job_id"], 1)["error"] == "boom"
+
+
+def test_jobs_are_private_and_bounded():
+    store = JobStore(workers=1, maxsize=2)
+    ids = [store.submit(1, "start", lambda: {})["job_id"] for _ in range(3)]
+    for job_id in ids:
+        if store.get(job_id, 1):
+            wait_for(store, job_id, 1)
+    store.submit(1, "start", lambda: {})
+
+    assert store.get(ids[-1], owner=2) is None
+    assert store.get(ids[0], owner=1) is None
+    assert len(store._jobs) == 2
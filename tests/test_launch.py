@@ -0,0 +1,92 @@
+import httpx
+import orjson
+import pytest
+
+from app.main import app
+from app.models.ec2 import InstanceLaunchRequest
+from app.services import manager, waiters
+from app.services.manager import launch_ec2_instance
+
+
+@pytest.fixture
+def request_for(ec2, ami, user, monkeypatch):
+    monkeypatch.setattr(waiters, "WAITER_POLL_INTERVAL", 0.01)
+    ec2.create_key_pair(KeyName="launch-key")
+    vpc = ec2.describe_vpcs()["Vpcs"][0]["VpcId"]
+    sg = ec2.create_security_group(GroupName="launch", Description="l", VpcId=vpc)
+
+    def build(count: int):
+        return InstanceLaunchRequest(
+            instance_type="t3.micro",
+            ami_id=ami,
+            key_name="launch-key",
+            security_group_id=sg["GroupId"],
+            region=user["region"],
+            count=count,
+            tags={"team": "infra"},
+        )
+
+    return build
+
+
+def test_many_instances_are_launched_in_one_call(ec2, user, request_for):
+    result = launch_ec2_instance(request_for(3), user)
+
+    assert (result["succeeded"], result["failed"]) == (3, 0)
+    iids = {r["instance_id"] for r in result["results"]}
+    reservations = ec2.describe_instances(InstanceIds=list(iids))["Reservations"]
+    assert len(reservations) == 1
+    tags = reservations[0]["Instances"][0]["Tags"]
+    assert {"Key": "team", "Value": "infra"} in tags
+
+
+def test_instances_that_die_are_reported_alongside_the_rest(
+    ec2, user, request_for, monkeypatch
+):
+    run_instances = manager.run_instances
+
+    def run_then_lose_one(data, user):
+        iids = run_instances(data, user)
+        ec2.terminate_instances(InstanceIds=iids[:1])
+        return iids
+
+    monkeypatch.setattr(manager, "run_instances", run_then_lose_one)
+    result = launch_ec2_instance(request_for(3), user)
+
+    assert (result["succeeded"], result["failed"]) == (2, 1)
+    failed = [r for r in result["results"] if "error" in r]
+    assert failed[0]["state"] in {"shutting-down", "terminated"}
+    running = [r for r in result["results"] if "error" not in r]
+    assert all(r["state"] == "running" and r["private_ip"] for r in running)
+
+
+def test_a_single_launch_returns_its_own_result(user, request_for):
+    result = launch_ec2_instance(request_for(1), user)
+    assert result["state"] == "running"
+    assert result["instance_id"].startswith("i-")
+
+
+def test_launch_streams_one_line_per_instance(ec2, request_for, run_db):
+    body = request_for(2).model_dump()
+    credentials = {
+        "aws_access_key_id": "AKIATEST",
+        "aws_secret_access_key": "secret",
+        "region": body["region"],
+    }
+
+    async def scenario(db):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://x") as c:
+            token = (await c.post("/auth/register", json=credentials)).json()["token"]
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/x-ndjson",
+                "Accept-Encoding": "gzip",
+            }
+            response = await c.post("/instances/", json=body, headers=headers)
+            return response.headers, response.text
+
+    headers, text = run_db(scenario)
+    assert "content-encoding" not in headers
+    lines = [orjson.loads(line) for line in text.splitlines()]
+    assert [line["state"] for line in lines] == ["running", "running"]
@@ -0,0 +1,27 @@
+import boto3
+import pytest
+from botocore.config import Config
+from botocore.exceptions import EndpointConnectionError
+
+from app.services.metrics import AWS_CALLS, AWS_ERRORS, instrument_client
+
+
+def test_connection_errors_reach_caller_and_are_counted():
+    ec2 = boto3.client(
+        "ec2",
+        region_name="us-east-1",
+        aws_access_key_id="AKIATEST",
+        aws_secret_access_key="secret",
+        # Nothing listens on port 9; the connection is refused at once.
+        endpoint_url="http://127.0.0.1:9",
+        config=Config(retries={"max_attempts": 1}, connect_timeout=1),
+    )
+    instrument_client(ec2)
+    calls = AWS_CALLS.labels("ec2", "DescribeInstances", "error")
+    errors = AWS_ERRORS.labels("ec2", "DescribeInstances", "EndpointConnectionError")
+    before = calls._value.get(), errors._value.get()
+
+    with pytest.raises(EndpointConnectionError):
+        ec2.describe_instances()
+
+    assert (calls._value.get(), errors._value.get()) == (before[0] + 1, before[1] + 1)
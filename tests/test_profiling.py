@@ -0,0 +1,58 @@
+import asyncio
+
+from app.services import profiling
+from app.services.executor import run_blocking
+from app.services.profiling import Profile, ProfilingMiddleware, span
+
+
+def test_spans_are_free_without_a_profile():
+    with span("db"):
+        pass
+    assert profiling.current_profile() is None
+
+
+def test_phases_follow_the_request_into_the_executor():
+    def blocking():
+        with span("aws_call"):
+            pass
+        return profiling.current_profile()
+
+    async def request():
+        profile = Profile("GET", "/")
+        token = profiling._current.set(profile)
+        try:
+            with span("auth"):
+                seen = await run_blocking(blocking)
+        finally:
+            profiling._current.reset(token)
+            profile.finish(200)
+        return profile, seen
+
+    profile, seen = asyncio.run(request())
+    assert seen is profile
+    assert set(profile.breakdown()) == {"auth", "aws_call"}
+    assert "auth;dur=" in profile.server_timing()
+
+
+def test_sampled_profiles_are_stored_without_response_headers(monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "admin")
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    def call(*headers):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/", "headers": headers}
+        asyncio.run(ProfilingMiddleware(app)(scope, None, send))
+        return dict(sent[0]["headers"])
+
+    stored = len(profiling.profiles)
+    assert b"server-timing" not in call()
+    assert b"server-timing" in call((b"x-profile", b"1"), (b"x-admin-token", b"admin"))
+    assert len(profiling.profiles) == stored + 2
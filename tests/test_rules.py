@@ -0,0 +1,64 @@
+from app.services.rules import RuleIndex
+
+
+def rule(gid, protocol, low, high, cidr=None, egress=False, n=[0]):
+    n[0] += 1
+    return {
+        "rule_id": f"sgr-{n[0]}",
+        "group_id": gid,
+        "direction": "egress" if egress else "ingress",
+        "protocol": protocol,
+        "from_port": low,
+        "to_port": high,
+        "cidr": cidr,
+        "referenced_group_id": None if cidr else "sg-other",
+        "prefix_list_id": None,
+        "description": None,
+    }
+
+
+def groups(rules):
+    return sorted({r["group_id"] for r in rules})
+
+
+INDEX_RULES = [
+    rule("sg-ssh", "tcp", 22, 22, "0.0.0.0/0"),
+    rule("sg-office", "tcp", 22, 22, "203.0.113.0/24"),
+    rule("sg-db", "tcp", 5000, 6000, "10.0.0.0/16"),
+    rule("sg-open", "-1", -1, -1, "0.0.0.0/0"),
+    rule("sg-peer", "tcp", 0, 65535),
+    rule("sg-v6", "tcp", 22, 22, "::/0"),
+    rule("sg-out", "-1", -1, -1, "0.0.0.0/0", egress=True),
+]
+
+
+def test_port_and_cidr_queries():
+    index = RuleIndex(INDEX_RULES)
+
+    assert groups(index.query(port=22, cidr="0.0.0.0/0")) == ["sg-open", "sg-ssh"]
+    assert groups(index.query(port=22, cidr="203.0.113.7/32")) == [
+        "sg-office",
+        "sg-open",
+        "sg-ssh",
+    ]
+    assert groups(index.query(port=5432, cidr="10.0.0.0/8")) == ["sg-open"]
+    assert groups(index.query(port=5432, cidr="10.0.0.0/8", overlaps=True)) == [
+        "sg-db",
+        "sg-open",
+    ]
+    assert groups(index.query(port=6001)) == ["sg-open", "sg-peer"]
+    assert groups(index.query(port=22, cidr="::/0")) == ["sg-v6"]
+    assert groups(index.query("egress", "udp", 53)) == ["sg-out"]
+
+
+def test_replacing_a_group_only_changes_its_rules():
+    index = RuleIndex(INDEX_RULES)
+    assert len(index.query(port=22, cidr="0.0.0.0/0")) == 2
+
+    index.replace_group("sg-ssh", [rule("sg-ssh", "tcp", 443, 443, "0.0.0.0/0")])
+    assert groups(index.query(port=22, cidr="0.0.0.0/0")) == ["sg-open"]
+    assert groups(index.query(port=443, cidr="0.0.0.0/0")) == ["sg-open", "sg-ssh"]
+
+    index.replace_group("sg-open", [])
+    assert groups(index.query(port=22, cidr="0.0.0.0/0")) == []
+    assert len(index) == len(INDEX_RULES) - 1
@@ -0,0 +1,63 @@
+from app.models.ec2 import Rule
+from app.services.manager import sync_security_group_rules
+
+
+def ingress(ec2, gid: str):
+    rules = ec2.describe_security_group_rules(
+        Filters=[{"Name": "group-id", "Values": [gid]}]
+    )["SecurityGroupRules"]
+    return {
+        (r["IpProtocol"], r["FromPort"], r["ToPort"], r.get("CidrIpv4"))
+        for r in rules
+        if not r["IsEgress"]
+    }
+
+
+def permission(port: int, to_port: int = None, cidr: str = None, group: str = None):
+    permission = {"IpProtocol": "tcp", "FromPort": port, "ToPort": to_port or port}
+    if cidr:
+        permission["IpRanges"] = [{"CidrIp": cidr}]
+    if group:
+        permission["UserIdGroupPairs"] = [{"GroupId": group}]
+    return permission
+
+
+def test_rules_are_diffed_against_the_group(ec2, user):
+    vpc = ec2.describe_vpcs()["Vpcs"][0]["VpcId"]
+    gid, other = (
+        ec2.create_security_group(GroupName=n, Description=n, VpcId=vpc)["GroupId"]
+        for n in ("web", "lb")
+    )
+    ec2.authorize_security_group_ingress(
+        GroupId=gid,
+        IpPermissions=[
+            permission(22, cidr="10.0.0.0/8"),
+            permission(80, cidr="0.0.0.0/0"),
+            permission(1000, 2000, cidr="0.0.0.0/0"),
+            permission(8080, group=other),
+        ],
+    )
+    desired = [
+        Rule(port=22, cidr="10.0.0.0/8"),
+        Rule(port=443),
+        Rule(protocol="udp", port=443),
+    ]
+
+    result = sync_security_group_rules(gid, desired, user)
+
+    assert (result["authorized"], result["revoked"], result["unchanged"]) == (2, 2, 1)
+    assert ingress(ec2, gid) == {
+        ("tcp", 22, 22, "10.0.0.0/8"),
+        ("tcp", 443, 443, "0.0.0.0/0"),
+        ("udp", 443, 443, "0.0.0.0/0"),
+        # Rules referencing other groups are left alone.
+        ("tcp", 8080, 8080, None),
+    }
+
+    again = sync_security_group_rules(gid, desired, user)
+    assert (again["authorized"], again["revoked"], again["unchanged"]) == (0, 0, 3)
+
+
+def test_failed_sync_reports_an_error(ec2, user):
+    result = sync_security_group_rules("sg-0000000000000000", [Rule(port=22)], user)
+    assert result["message"] == "Couldn't sync rules for sg-0000000000000000."
@@ -0,0 +1,72 @@
+import asyncio
+
+from starlette.requests import Request
+
+from app.services.serialize import CompressionMiddleware, list_response
+
+
+def request(**headers):
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "headers": raw})
+
+
+def test_etag_is_stable_across_key_order():
+    first = list_response({"items": [{"a": 1, "b": 2}]}, "items")
+    second = list_response({"items": [{"b": 2, "a": 1}]}, "items")
+    assert first.headers["etag"] == second.headers["etag"]
+    assert not first.headers["etag"].startswith("W/")
+
+
+def test_matching_if_none_match_gets_empty_304():
+    tag = list_response({"items": [1]}, "items").headers["etag"]
+
+    response = list_response(
+        {"items": [1]}, "items", request=request(if_none_match=tag)
+    )
+    assert response.status_code == 304
+    assert response.body == b""
+
+    response = list_response(
+        {"items": [2]}, "items", request=request(if_none_match=tag)
+    )
+    assert response.status_code == 200
+
+
+def test_error_payloads_have_no_etag():
+    response = list_response({"error": "boom", "message": "failed"}, "items")
+    assert "etag" not in response.headers
+
+
+def test_ndjson_streams_are_not_held_back_by_gzip():
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")],
+            }
+        )
+        await send(
+            {"type": "http.response.body", "body": b"{}\n" * 600, "more_body": True}
+        )
+        await send({"type": "http.response.body", "body": b""})
+
+    async def call(accept: str):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "headers": [(b"accept-encoding", b"gzip"), (b"accept", accept.encode())],
+        }
+        await CompressionMiddleware(app, minimum_size=10)(scope, None, send)
+        return sent
+
+    sent = asyncio.run(call("application/x-ndjson"))
+    assert sent[1]["body"] == b"{}\n" * 600
+    assert b"content-encoding" not in dict(sent[0]["headers"])
+
+    sent = asyncio.run(call("application/json"))
+    assert dict(sent[0]["headers"])[b"content-encoding"] == b"gzip"
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from app.services.singleflight import SingleFlight, coalesced, flights
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(1)
+        return {"instances": []}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("k", fetch)))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_linger_reuses_finished_result():
+    flight = SingleFlight(linger=60)
+    assert flight.do("k", lambda: 1) == 1
+    assert flight.do("k", lambda: 2) == 1
+    assert SingleFlight(linger=0).do("k", lambda: 2) == 2
+
+
+def test_keys_include_account_region_and_arguments():
+    seen = []
+
+    @coalesced("describe_things")
+    def describe_things(user: dict, name: str = None):
+        seen.append((user["region"], name))
+        return len(seen)
+
+    user = {"access_key": "AKIA", "secret_key": "s", "region": "us-east-1"}
+    flights.linger, previous = 60, flights.linger
+    try:
+        describe_things(user)
+        describe_things(user=user, name=None)
+        describe_things(user, name="web")
+        describe_things(dict(user, region="eu-west-1"))
+    finally:
+        flights.linger = previous
+    assert seen == [("us-east-1", None), ("us-east-1", "web"), ("eu-west-1", None)]
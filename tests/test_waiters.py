@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from app.services import waiters
+from app.services.waiters import StateError, WaiterService
+
+USER = {"access_key": "AKIATEST", "secret_key": "secret", "region": "ap-south-1"}
+
+
+class FakeEC2:
+    def __init__(self, states: dict):
+        self.states = states
+        self.calls = []
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Filters):
+        ids = Filters[0]["Values"]
+        self.calls.append(ids)
+        instances = [
+            {"InstanceId": iid, "State": {"Name": self.states[iid]}}
+            for iid in ids
+            if iid in self.states
+        ]
+        return [{"Reservations": [{"Instances": instances}]}]
+
+
+@pytest.fixture
+def ec2(monkeypatch):
+    fake = FakeEC2({"i-1": "pending", "i-2": "pending", "i-3": "pending"})
+    monkeypatch.setattr(waiters, "get_client", lambda *a, **kw: fake)
+    monkeypatch.setattr(waiters, "WAITER_POLL_INTERVAL", 0.01)
+    return fake
+
+
+def test_callers_share_one_describe_per_tick(ec2):
+    service = WaiterService()
+    futures = [service.wait(USER, [iid], "running") for iid in ("i-1", "i-2", "i-3")]
+    time.sleep(0.05)
+    ec2.states.update({"i-1": "running", "i-2": "running", "i-3": "running"})
+
+    for waits in futures:
+        for future in waits.values():
+            assert future.result(1)["State"]["Name"] == "running"
+    # Once every caller was registered, each tick was one call for all of them.
+    assert sorted(ec2.calls[-1]) == ["i-1", "i-2", "i-3"]
+
+
+def test_failure_states_and_timeouts(ec2):
+    ec2.states.update({"i-1": "stopping", "i-2": "stopped"})
+    service = WaiterService()
+    futures = service.wait(USER, ["i-1", "i-2", "i-unknown"], "running", timeout=0.5)
+
+    with pytest.raises(StateError):
+        futures["i-1"].result(1)
+    # A just-started instance can still read as stopped; keep waiting.
+    time.sleep(0.05)
+    assert not futures["i-2"].done()
+    ec2.states["i-2"] = "running"
+    assert futures["i-2"].result(1)["State"]["Name"] == "running"
+    with pytest.raises(TimeoutError):
+        futures["i-unknown"].result(1)
+
+
+def test_a_new_waiter_is_not_pruned_before_it_starts(ec2, monkeypatch):
+    service = WaiterService()
+    other = dict(USER, access_key="AKIAOTHER")
+    add = waiters.AccountWaiter.add
+    created = []
+
+    def add_after_another_account(self, iid, target, timeout):
+        if not created:
+            created.append(self)
+            # Another account's first wait arrives in between.
+            thread = threading.Thread(target=service.wait, args=(other, [], "running"))
+            thread.start()
+            thread.join(0.1)
+        return add(self, iid, target, timeout)
+
+    monkeypatch.setattr(waiters.AccountWaiter, "add", add_after_another_account)
+    service.wait(USER, ["i-1"], "running")
+    service.wait(USER, ["i-2"], "running")
+
+    # Both waits went to one poller.
+    assert created[0].pending() == 2